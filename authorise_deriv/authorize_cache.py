@@ -0,0 +1,137 @@
+"""
+Cached Deriv authorization for the /authorize/ endpoint.
+
+The frontend authorizes the same token again and again, and every call used
+to open a new websocket for a single authorize round trip. Responses are now
+kept for AUTHORIZE_CACHE_TTL seconds, keyed by a SHA-256 of the token and
+without the echoed request, so raw tokens are never stored. Tokens Deriv
+rejects are remembered for AUTHORIZE_NEGATIVE_TTL seconds, so a client
+retrying a bad token does not reach Deriv each time.
+
+Misses go through one DerivConnectionPool running on a background event
+loop thread. Django may run an async view on a fresh event loop per request
+(under WSGI), and websockets cannot be shared between loops, so the pool
+lives on its own loop and requests hand their authorize call to it. Identical
+concurrent misses are coalesced there: only the first reaches Deriv, the
+others wait for its result.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from deriv_api.errors import ResponseError
+
+from .deriv_pool import DerivConnectionPool
+from .resilience import TRANSIENT_ERRORS
+
+AUTHORIZE_CACHE_TTL = int(os.getenv('AUTHORIZE_CACHE_TTL', '300'))
+AUTHORIZE_NEGATIVE_TTL = int(os.getenv('AUTHORIZE_NEGATIVE_TTL', '30'))
+AUTHORIZE_CACHE_MAX_ENTRIES = int(os.getenv('AUTHORIZE_CACHE_MAX_ENTRIES', '10000'))
+AUTHORIZE_POOL_SIZE = int(os.getenv('AUTHORIZE_POOL_SIZE', '4'))
+
+
+
+def token_key(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class AuthorizeCache:
+    """
+    TTL cache of authorize responses with negative caching and single-flight misses.
+    """
+
+    def __init__(self, app_id, ttl=AUTHORIZE_CACHE_TTL, negative_ttl=AUTHORIZE_NEGATIVE_TTL,
+                 max_entries=AUTHORIZE_CACHE_MAX_ENTRIES, pool_size=AUTHORIZE_POOL_SIZE):
+        self.app_id = app_id
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.pool_size = pool_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, response or error dict)
+        self._lock = threading.Lock()
+        self._loop = None
+        self._loop_pid = None
+        self._pool = None
+        self._in_flight = {}  # key -> task, only touched on the background loop
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _store(self, key, ttl, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token):
+        with self._lock:
+            self._entries.pop(token_key(token), None)
+
+    def _background_loop(self):
+        with self._lock:
+            # A forked worker does not inherit the thread running the loop
+            if self._loop is None or self._loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='deriv-authorize', daemon=True).start()
+                self._loop = loop
+                self._loop_pid = os.getpid()
+                self._pool = DerivConnectionPool(self.app_id, size=self.pool_size)
+                self._in_flight = {}
+            return self._loop
+
+    async def _fetch(self, key, token):
+        # Runs on the background loop
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._authorize(key, token))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _authorize(self, key, token):
+        try:
+            response = await self._pool.authorize(token)
+        except ResponseError as e:
+            # Rejections that say nothing about the token itself are never cached
+            if e.code not in TRANSIENT_ERRORS:
+                # Keep only the error, not the echoed request with the token
+                self._store(key, self.negative_ttl, {
+                    'error': {'code': e.code, 'message': e.message},
+                    'echo_req': {}, 'msg_type': e.msg_type,
+                })
+            raise
+        # The echoed request holds the raw token; keep everything else
+        response = {**response, 'echo_req': {}}
+        self._store(key, self.ttl, response)
+        return response
+
+    async def authorize(self, token):
+        """
+        Return the authorize response for `token`, raising ResponseError if Deriv rejects it.
+        """
+        key = token_key(token)
+        entry = self._lookup(key)
+        if entry is not None:
+            value = entry[1]
+            if 'error' in value:
+                raise ResponseError(value)
+            return value
+        future = asyncio.run_coroutine_threadsafe(self._fetch(key, token), self._background_loop())
+        return await asyncio.wrap_future(future)
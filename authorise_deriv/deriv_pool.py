@@ -0,0 +1,262 @@
+import asyncio
+import os
+import time
+
+from deriv_api import DerivAPI
+from deriv_api.errors import ResponseError
+
+from forex.clickhouse.metrics import DERIV_DURATION, DERIV_ERRORS, DERIV_RETRIES
+
+from .resilience import (
+    DERIV_MAX_RETRIES, RATE_LIMIT_ERRORS, TRANSIENT_ERRORS, CircuitOpenError, backoff_delay, get_deriv_guards,
+)
+
+# Number of Deriv websocket connections kept open by a pool, and the number of
+# balance requests allowed in flight at once across those connections.
+DERIV_POOL_SIZE = int(os.getenv('DERIV_POOL_SIZE', '8'))
+DERIV_MAX_IN_FLIGHT = int(os.getenv('DERIV_MAX_IN_FLIGHT', str(DERIV_POOL_SIZE)))
+# Deriv websocket host, or a full ws:// URL such as a local stub for benchmarks
+DERIV_ENDPOINT = os.getenv('DERIV_ENDPOINT', 'ws.derivws.com')
+# Seconds to wait for one Deriv response before the call counts as failed
+DERIV_CALL_TIMEOUT = float(os.getenv('DERIV_CALL_TIMEOUT', '10'))
+
+
+class _NoCache:
+    """
+    DerivAPI response storage that keeps nothing.
+
+    DerivAPI caches every response by default, keyed by the request, and an
+    authorize request holds the raw token, so a long-lived connection would
+    retain every token it was ever authorized with.
+    """
+
+    def has(self, key):
+        return False
+
+    def get(self, key):
+        raise KeyError(key)
+
+    def get_by_msg_type(self, msg_type):
+        return None
+
+    def set(self, key, value):
+        pass
+
+
+def open_deriv_api(app_id):
+    """
+    A new DerivAPI client for DERIV_ENDPOINT that caches no responses.
+    """
+    return DerivAPI(app_id=app_id, endpoint=DERIV_ENDPOINT, cache=_NoCache())
+
+
+async def _guarded(call, func, limiter, breaker, timeout):
+    """
+    Make one Deriv request, `func()`, through the circuit breaker, rate limiter and timeout, recording its outcome.
+    """
+    # Fail fast while Deriv is down instead of queueing behind the limiter
+    breaker.raise_if_open()
+    await limiter.acquire()
+    breaker.before_call()
+    started = time.perf_counter()
+    try:
+        async with asyncio.timeout(timeout):
+            result = await func()
+    except ResponseError as e:
+        DERIV_ERRORS.labels(call, e.code or 'ResponseError').inc()
+        if e.code in RATE_LIMIT_ERRORS:
+            limiter.on_rate_limited()
+        if e.code in TRANSIENT_ERRORS and e.code not in RATE_LIMIT_ERRORS:
+            breaker.record_failure()
+        else:
+            # Deriv answered, so it is up even if it refused this request
+            breaker.record_success()
+        raise
+    except Exception as e:
+        DERIV_ERRORS.labels(call, type(e).__name__).inc()
+        breaker.record_failure()
+        raise
+    finally:
+        DERIV_DURATION.labels(call).observe(time.perf_counter() - started)
+    limiter.on_success()
+    breaker.record_success()
+    return result
+
+
+async def _with_retries(call, attempt_once, max_retries):
+    """
+    Await `attempt_once()`, retrying transient failures with backoff; circuit-open errors are not retried.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await attempt_once()
+        except CircuitOpenError:
+            raise
+        except ResponseError as e:
+            if e.code not in TRANSIENT_ERRORS or attempt >= max_retries:
+                raise
+        except Exception:
+            if attempt >= max_retries:
+                raise
+        DERIV_RETRIES.labels(call).inc()
+        await asyncio.sleep(backoff_delay(attempt))
+        attempt += 1
+
+
+async def guarded_call(call, func, max_retries=DERIV_MAX_RETRIES, timeout=DERIV_CALL_TIMEOUT):
+    """
+    Run `func()`, a Deriv request on a connection outside any pool, with the
+    same rate limiting, retries and circuit breaking as pooled calls.
+    """
+    limiter, breaker = get_deriv_guards()
+    return await _with_retries(call, lambda: _guarded(call, func, limiter, breaker, timeout), max_retries)
+
+
+class _PooledConnection:
+    """
+    A Deriv websocket plus the token it is currently authorized with.
+    """
+
+    def __init__(self, app_id):
+        self.app_id = app_id
+        self.api = None
+        self.token = None
+
+    async def ensure_authorized(self, token, force=False):
+        """
+        Authorize with `token` unless already authorized with it; returns the
+        authorize response, or None when no round trip was needed.
+        """
+        if self.api is None:
+            self.api = open_deriv_api(self.app_id)
+            self.token = None
+        # Only pay for an authorize round trip when the connection switches account
+        if self.token != token or force:
+            self.token = None
+            authorize = await self.api.authorize(token)
+            if not authorize:
+                raise ValueError("Authorization failed")
+            self.token = token
+            return authorize
+        return None
+
+    async def close(self):
+        api, self.api, self.token = self.api, None, None
+        if api is not None:
+            try:
+                await api.disconnect()
+            except Exception:
+                pass
+
+
+class DerivConnectionPool:
+    """
+    A small pool of reused Deriv websocket connections.
+
+    Connections are opened lazily, handed out one request at a time and
+    re-authorized only when the next request is for a different token. A
+    connection that fails below the API level is closed and reopened on its
+    next use.
+
+    Calls go through the process-wide rate limiter and circuit breaker
+    (resilience.py) and transient failures are retried with backoff, so a
+    call either returns real data or raises.
+    """
+
+    def __init__(self, app_id, size=DERIV_POOL_SIZE, max_retries=DERIV_MAX_RETRIES, timeout=DERIV_CALL_TIMEOUT):
+        self.app_id = app_id
+        self.size = size
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.limiter, self.breaker = get_deriv_guards()
+        self._idle = None
+
+    def _queue(self):
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for _ in range(self.size):
+                self._idle.put_nowait(_PooledConnection(self.app_id))
+        return self._idle
+
+    async def balance(self, token):
+        """
+        Return the account balance for `token`, raising on any failure.
+        """
+        return await self._call(token, self._balance)
+
+    async def authorize(self, token):
+        """
+        Return the full authorize response for `token`, raising on any failure.
+        """
+        return await self._call(token, self._authorize)
+
+    @staticmethod
+    async def _balance(conn, token):
+        await conn.ensure_authorized(token)
+        response = await conn.api.balance()
+        return response['balance']['balance']
+
+    @staticmethod
+    async def _authorize(conn, token):
+        return await conn.ensure_authorized(token, force=True)
+
+    async def _call(self, token, request):
+        call = request.__name__.lstrip('_')
+        return await _with_retries(call, lambda: self._attempt(call, token, request), self.max_retries)
+
+    async def _attempt(self, call, token, request):
+        idle = self._queue()
+        conn = await idle.get()
+        try:
+            return await _guarded(call, lambda: request(conn, token), self.limiter, self.breaker, self.timeout)
+        except CircuitOpenError:
+            raise
+        except ResponseError:
+            # The API rejected the request; the socket itself is still usable
+            conn.token = None
+            raise
+        except Exception:
+            await conn.close()
+            raise
+        finally:
+            idle.put_nowait(conn)
+
+    async def close(self):
+        if self._idle is None:
+            return
+        while not self._idle.empty():
+            await self._idle.get_nowait().close()
+        self._idle = None
+
+
+async def fetch_balances(tokens, app_id, pool_size=DERIV_POOL_SIZE, max_in_flight=DERIV_MAX_IN_FLIGHT, pool=None):
+    """
+    Fetch balances for many tokens with bounded concurrency over a shared pool.
+
+    Pass `pool` to reuse connections across calls; otherwise a pool is
+    opened for this call and closed when it returns.
+
+    Returns a pair of dicts: token -> balance for successful lookups and
+    token -> exception for the ones that failed.
+    """
+    owns_pool = pool is None
+    if owns_pool:
+        pool = DerivConnectionPool(app_id, size=pool_size)
+    limit = asyncio.Semaphore(max_in_flight)
+    balances = {}
+    failures = {}
+
+    async def fetch(token):
+        async with limit:
+            try:
+                balances[token] = await pool.balance(token)
+            except Exception as e:
+                failures[token] = e
+
+    try:
+        await asyncio.gather(*(fetch(token) for token in tokens))
+    finally:
+        if owns_pool:
+            await pool.close()
+    return balances, failures
@@ -0,0 +1,201 @@
+"""
+Rate limiting, retries and circuit breaking for Deriv API calls.
+
+Every call made through a DerivConnectionPool passes three guards, shared by
+all pools in the process:
+
+- AdaptiveRateLimiter: a per-process token bucket whose rate adapts to Deriv. A
+  RateLimit response halves the rate (down to DERIV_MIN_RATE, at most once
+  per second, since concurrent calls are throttled together), and every
+  success raises it a little again (up to DERIV_MAX_RATE), so balance
+  collection settles just under the rate Deriv accepts. DERIV_MAX_RATE=0
+  turns the limiter off.
+- Retries with exponential backoff and full jitter (DERIV_MAX_RETRIES) for
+  rate limits, timeouts, dropped connections and Deriv internal errors.
+  Rejections of the request itself, such as an invalid token, are not retried.
+- CircuitBreaker: after DERIV_BREAKER_FAILURES consecutive failures the
+  circuit opens and calls fail at once with CircuitOpenError for
+  DERIV_BREAKER_RESET_TIMEOUT seconds. A single trial call then decides
+  whether it closes again.
+
+The limiter and breaker are thread-safe and never hold a lock while waiting,
+so pools running on different event loops (the job runner and the
+/authorize/ cache thread) share them.
+"""
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+
+from forex.clickhouse.metrics import DERIV_CIRCUIT_OPEN, DERIV_RATE
+
+DERIV_MAX_RATE = float(os.getenv('DERIV_MAX_RATE', '100'))
+DERIV_MIN_RATE = float(os.getenv('DERIV_MIN_RATE', '1'))
+DERIV_BURST = int(os.getenv('DERIV_BURST', '10'))
+DERIV_MAX_RETRIES = int(os.getenv('DERIV_MAX_RETRIES', '5'))
+DERIV_BACKOFF_BASE = float(os.getenv('DERIV_BACKOFF_BASE', '0.5'))
+DERIV_BACKOFF_MAX = float(os.getenv('DERIV_BACKOFF_MAX', '10'))
+DERIV_BREAKER_FAILURES = int(os.getenv('DERIV_BREAKER_FAILURES', '5'))
+DERIV_BREAKER_RESET_TIMEOUT = float(os.getenv('DERIV_BREAKER_RESET_TIMEOUT', '30'))
+
+# Error codes that say Deriv is throttling or failing, not that the request is wrong
+RATE_LIMIT_ERRORS = ('RateLimit',)
+TRANSIENT_ERRORS = RATE_LIMIT_ERRORS + ('InternalServerError',)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling Deriv while the circuit breaker is open.
+    """
+
+    def __init__(self, retry_after):
+        super().__init__(f"Deriv API calls are paused for {math.ceil(retry_after)} more seconds after repeated failures")
+        self.retry_after = retry_after
+
+
+def backoff_delay(attempt, base=DERIV_BACKOFF_BASE, cap=DERIV_BACKOFF_MAX):
+    """
+    Seconds to wait before retry number `attempt` (0-based): full jitter over an exponential ceiling.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket with additive-increase / multiplicative-decrease of its rate.
+    """
+
+    def __init__(self, max_rate=DERIV_MAX_RATE, min_rate=DERIV_MIN_RATE, burst=DERIV_BURST):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.rate = max_rate
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._decreased_at = None
+        self._lock = threading.Lock()
+        DERIV_RATE.set(self.rate)
+
+    def _reserve(self):
+        """
+        Take a token, borrowing against the future if none is left; returns the seconds to wait.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    async def acquire(self):
+        if self.max_rate <= 0:
+            return
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def on_success(self):
+        with self._lock:
+            if 0 < self.rate < self.max_rate:
+                # 1/rate per call: the rate grows by about one request per second, every second
+                self.rate = min(self.max_rate, self.rate + 1 / self.rate)
+                DERIV_RATE.set(self.rate)
+
+    def on_rate_limited(self):
+        if self.max_rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            # Calls already in flight at the old rate get throttled too; count them once
+            if self._decreased_at is not None and now - self._decreased_at < 1:
+                return
+            self._decreased_at = now
+            self.rate = max(self.min_rate, self.rate / 2)
+            # Drop saved-up tokens so the lower rate applies right away
+            self._tokens = min(self._tokens, 0.0)
+            DERIV_RATE.set(self.rate)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker: closed, open, then half-open for one trial call.
+    """
+
+    def __init__(self, failure_threshold=DERIV_BREAKER_FAILURES, reset_timeout=DERIV_BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at = None
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return 'open'
+            return 'half-open'
+
+    def raise_if_open(self):
+        """
+        Fail fast while the circuit is open, without claiming the half-open trial.
+        """
+        with self._lock:
+            if self._opened_at is not None:
+                remaining = self._opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpenError(remaining)
+
+    def before_call(self):
+        """
+        Raise CircuitOpenError unless a call may go ahead now.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            now = time.monotonic()
+            remaining = self._opened_at + self.reset_timeout - now
+            if remaining > 0:
+                raise CircuitOpenError(remaining)
+            # Half-open: let one trial call through; a trial that never reports back expires
+            if self._trial_started is not None and now - self._trial_started < self.reset_timeout:
+                raise CircuitOpenError(self._trial_started + self.reset_timeout - now)
+            self._trial_started = now
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self._opened_at is not None:
+                self._opened_at = self._trial_started = None
+                DERIV_CIRCUIT_OPEN.set(0)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_started is not None or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._trial_started = None
+                DERIV_CIRCUIT_OPEN.set(1)
+
+
+_lock = threading.Lock()
+_limiter = None
+_breaker = None
+_guards_pid = None
+
+
+def get_deriv_guards():
+    """
+    The process-wide (AdaptiveRateLimiter, CircuitBreaker) pair used by every Deriv pool.
+    """
+    global _limiter, _breaker, _guards_pid
+    with _lock:
+        if _limiter is None or _guards_pid != os.getpid():
+            _limiter = AdaptiveRateLimiter()
+            _breaker = CircuitBreaker()
+            _guards_pid = os.getpid()
+        return _limiter, _breaker
@@ -1,3 +1,198 @@
-from django.test import TestCase
+import asyncio
+import json
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from deriv_api import DerivAPI
+from deriv_api.errors import ResponseError
+from django.test import SimpleTestCase
+
+from authorise_deriv import deriv_pool, resilience
+from authorise_deriv.authorize_cache import AuthorizeCache, token_key
+from authorise_deriv.resilience import AdaptiveRateLimiter, CircuitBreaker, CircuitOpenError
+
+
+
+class _AuthorizeSocket:
+    """
+    Stands in for the Deriv websocket: answers every authorize request, echoing it like Deriv does.
+    """
+
+    def __init__(self):
+        self.responses = asyncio.Queue()
+
+    async def send(self, data):
+        request = json.loads(data)
+        self.responses.put_nowait(json.dumps({
+            'msg_type': 'authorize', 'req_id': request['req_id'], 'echo_req': request,
+            'authorize': {'email': f"{request['authorize']}@example.com"},
+        }))
+
+    async def recv(self):
+        return await self.responses.get()
+
+    async def close(self):
+        pass
+
+
+class AuthorizeCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(
+            deriv_pool, 'DerivAPI', lambda **options: DerivAPI(connection=_AuthorizeSocket(), **options),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _shut_down(cache):
+        if cache._loop is not None:
+            asyncio.run_coroutine_threadsafe(cache._pool.close(), cache._loop).result()
+
+    def test_evicts_the_least_recently_used_entry(self):
+        cache = AuthorizeCache(app_id=1, max_entries=2)
+        cache._store('a', 60, {'authorize': 'a'})
+        cache._store('b', 60, {'authorize': 'b'})
+        cache._lookup('a')
+        cache._store('c', 60, {'authorize': 'c'})
+        self.assertEqual(list(cache._entries), ['a', 'c'])
+        self.assertIsNone(cache._lookup('b'))
+
+    def test_expired_entries_are_misses(self):
+        cache = AuthorizeCache(app_id=1)
+        cache._store('a', 0, {'authorize': 'a'})
+        self.assertIsNone(cache._lookup('a'))
+        self.assertEqual((cache.hits, cache.misses, len(cache._entries)), (0, 1, 0))
+
+    def test_rejected_token_is_answered_from_the_cache(self):
+        cache = AuthorizeCache(app_id=1)
+        cache._store(token_key('bad'), 60, {
+            'error': {'code': 'InvalidToken', 'message': 'The token is invalid.'},
+            'echo_req': {}, 'msg_type': 'authorize',
+        })
+        with self.assertRaises(ResponseError) as raised:
+            async_to_sync(cache.authorize)('bad')
+        self.assertEqual(raised.exception.code, 'InvalidToken')
+        self.assertIsNone(cache._loop)
+
+    def test_retains_no_more_than_the_bounded_lru(self):
+        cache = AuthorizeCache(app_id=1, max_entries=10, pool_size=2)
+        self.addCleanup(self._shut_down, cache)
+        tokens = [f"token-{i}" for i in range(200)]
+        for token in tokens:
+            response = async_to_sync(cache.authorize)(token)
+            self.assertEqual(response['authorize']['email'], f"{token}@example.com")
+            self.assertEqual(response['echo_req'], {})
+
+        self.assertEqual(len(cache._entries), 10)
+        self.assertEqual(list(cache._entries), [token_key(token) for token in tokens[-10:]])
+        connections = list(cache._pool._idle._queue)
+        self.assertTrue(all(conn.api is not None for conn in connections))
+        for conn in connections:
+            # Nothing kept by DerivAPI's own response cache either
+            self.assertIsNone(conn.api.cache.storage.get_by_msg_type('authorize'))
+        self.assertNotIn('token-0', repr(cache._entries))
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ResilienceTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = _Clock()
+        patcher = mock.patch.object(resilience.time, 'monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class CircuitBreakerTests(ResilienceTestCase):
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'closed')
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError) as raised:
+            breaker.before_call()
+        self.assertEqual(raised.exception.retry_after, 30)
+
+    def test_half_open_lets_one_trial_through(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        self.clock.now += 30
+        self.assertEqual(breaker.state, 'half-open')
+        breaker.raise_if_open()
+        breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+        breaker.before_call()
+
+    def test_failed_trial_opens_again(self):
+        breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+        for _ in range(5):
+            breaker.record_failure()
+        self.clock.now += 30
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+
+    def test_trial_that_never_reports_back_expires(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        self.clock.now += 30
+        breaker.before_call()
+        self.clock.now += 30
+        breaker.before_call()
+
+
+class AdaptiveRateLimiterTests(ResilienceTestCase):
+
+    def test_rate_limit_halves_the_rate_once_per_second(self):
+        limiter = AdaptiveRateLimiter(max_rate=100, min_rate=10, burst=5)
+        limiter.on_rate_limited()
+        limiter.on_rate_limited()
+        self.assertEqual(limiter.rate, 50)
+        for _ in range(3):
+            self.clock.now += 1
+            limiter.on_rate_limited()
+        self.assertEqual(limiter.rate, 10)
+
+    def test_successes_raise_the_rate_up_to_the_maximum(self):
+        limiter = AdaptiveRateLimiter(max_rate=100, min_rate=10, burst=5)
+        limiter.on_rate_limited()
+        limiter.on_success()
+        self.assertAlmostEqual(limiter.rate, 50.02)
+        for _ in range(10000):
+            limiter.on_success()
+        self.assertEqual(limiter.rate, 100)
+
+    def test_waits_once_the_burst_is_spent(self):
+        limiter = AdaptiveRateLimiter(max_rate=10, min_rate=1, burst=2)
+        self.assertEqual([limiter._reserve() for _ in range(4)], [0.0, 0.0, 0.1, 0.2])
+        self.clock.now += 0.35
+        self.assertEqual(limiter._reserve(), 0.0)
+
+    def test_rate_limit_drops_saved_tokens(self):
+        limiter = AdaptiveRateLimiter(max_rate=10, min_rate=1, burst=5)
+        limiter.on_rate_limited()
+        self.assertEqual(limiter._reserve(), 0.2)
+
+    def test_zero_max_rate_disables_the_limiter(self):
+        limiter = AdaptiveRateLimiter(max_rate=0, burst=0)
+        limiter.on_rate_limited()
+        async_to_sync(limiter.acquire)()
+        self.assertEqual(limiter.rate, 0)
@@ -1,10 +1,15 @@
 from django.shortcuts import render
 from django.http import JsonResponse
-from deriv_api import DerivAPI
+from deriv_api.errors import ResponseError
 from django.views.decorators.csrf import csrf_exempt
 import json
+from .authorize_cache import AuthorizeCache
+from .deriv_pool import DerivConnectionPool
+from .resilience import TRANSIENT_ERRORS, CircuitOpenError
 # Initialize DerivAPI client
 app_id = 65102
+# Authorize responses per token, shared by all requests in the process
+authorize_cache = AuthorizeCache(app_id)
 @csrf_exempt
 async def authorize_user(request):
     if request.method == "POST":
@@ -15,30 +20,33 @@ async def authorize_user(request):
             
             if not token:
                 return JsonResponse({"error": "Token is required"}, status=400)
-            api = DerivAPI(app_id=app_id)
-            authorize = await api.authorize(token)
-            if "error" in authorize:
-                return JsonResponse({"error": authorize["error"]["message"]}, status=401)
+            try:
+                authorize = await authorize_cache.authorize(token)
+            except CircuitOpenError as e:
+                response = JsonResponse({"error": str(e)}, status=503)
+                response["Retry-After"] = str(max(1, round(e.retry_after)))
+                return response
+            except ResponseError as e:
+                if e.code in TRANSIENT_ERRORS:
+                    return JsonResponse({"error": e.message}, status=503)
+                return JsonResponse({"error": e.message}, status=401)
             return JsonResponse({"authorize": authorize}, status=200)
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
     return JsonResponse({"error": "Invalid request method"}, status=405)
 
 async def balance(token):
-    try:
-        # Initialize the API
-        api = DerivAPI(app_id=app_id)
-        authorize = await api.authorize(token)
-        
-        if not authorize:
-            raise ValueError("Authorization failed")
-
-        # Get account balance
-        response = await api.balance()
-        account_balance = response.get('balance', {}).get('balance', 0)
+    """
+    Return the account balance for `token`.
 
-        return account_balance
-    except Exception as e:
-        return 0
+    Raises when the balance cannot be fetched (after retries, or at once while
+    the Deriv circuit breaker is open) rather than returning 0, which callers
+    would store as a real balance.
+    """
+    pool = DerivConnectionPool(app_id, size=1)
+    try:
+        return await pool.balance(token)
+    finally:
+        await pool.close()
 
 
@@ -0,0 +1,168 @@
+"""
+Load test /authorize/ under the WSGI and ASGI serving modes.
+
+Starts the Deriv stub and, for each mode, gunicorn with gunicorn.conf.py
+pointed at the stub. It then sends POST /authorize/ from `--concurrency`
+keep-alive clients for `--duration` seconds and reports requests per second
+and latency percentiles. By default the authorize cache is disabled, so every
+request reaches the stub; pass --cache to measure cached repeat calls.
+
+Usage:
+    python -m benchmarks.authorize_load --workers 2 --concurrency 64 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout} seconds")
+
+
+async def _read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def _client(port, tokens, offset, deadline, latencies, errors):
+    reader = writer = None
+    i = offset
+    while time.monotonic() < deadline:
+        if writer is None:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        body = json.dumps({'token': tokens[i % len(tokens)]}).encode()
+        i += 1
+        started = time.perf_counter()
+        writer.write(
+            b'POST /authorize/ HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+            + f'Content-Length: {len(body)}\r\n\r\n'.encode() + body
+        )
+        try:
+            status, keep_alive = await _read_response(reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            errors.append('connection')
+            writer.close()
+            writer = None
+            continue
+        latencies.append(time.perf_counter() - started)
+        if status != 200:
+            errors.append(status)
+        if not keep_alive:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def _load(port, tokens, concurrency, duration):
+    latencies, errors = [], []
+    deadline = time.monotonic() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _client(port, tokens, n * 997, deadline, latencies, errors) for n in range(concurrency)
+    ))
+    return latencies, errors, time.perf_counter() - started
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else float('nan')
+
+
+def run_mode(mode, args, stub_port):
+    port = _free_port()
+    env = dict(
+        os.environ,
+        SERVER_MODE=mode,
+        PORT=str(port),
+        WEB_CONCURRENCY=str(args.workers),
+        DERIV_ENDPOINT=f'ws://127.0.0.1:{stub_port}',
+        AUTHORIZE_CACHE_TTL=os.environ.get('AUTHORIZE_CACHE_TTL', '300') if args.cache else '0',
+        AUTHORIZE_NEGATIVE_TTL='30' if args.cache else '0',
+        DJANGO_SETTINGS_MODULE='forex.settings',
+    )
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', '--log-level', 'warning'],
+        cwd=ROOT, env=env,
+    )
+    try:
+        _wait_for_port(port)
+        tokens = [f'token-{n}' for n in range(args.tokens)]
+        # Warm up every worker before measuring
+        asyncio.run(_load(port, tokens, args.concurrency, 1))
+        latencies, errors, elapsed = asyncio.run(_load(port, tokens, args.concurrency, args.duration))
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        'mode': mode,
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50': _percentile(latencies, 0.5) * 1000,
+        'p99': _percentile(latencies, 0.99) * 1000,
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modes', nargs='+', default=['wsgi', 'asgi'], choices=['wsgi', 'asgi'])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--tokens', type=int, default=1000, help="distinct tokens to cycle through")
+    parser.add_argument('--latency-ms', type=float, default=20, help="Deriv stub latency per request")
+    parser.add_argument('--cache', action='store_true', help="keep the authorize cache enabled")
+    args = parser.parse_args()
+
+    stub_port = _free_port()
+    stub = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.deriv_stub', '--port', str(stub_port),
+         '--latency-ms', str(args.latency_ms)],
+        cwd=ROOT,
+    )
+    try:
+        _wait_for_port(stub_port)
+        results = [run_mode(mode, args, stub_port) for mode in args.modes]
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    print(f"\n{args.workers} worker(s), {args.concurrency} clients, {args.duration:.0f}s, "
+          f"stub latency {args.latency_ms:.0f} ms, cache {'on' if args.cache else 'off'}")
+    print(f"{'mode':>6}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for r in results:
+        print(f"{r['mode']:>6}{r['requests']:>10}{r['rps']:>10.1f}{r['p50']:>10.1f}{r['p99']:>10.1f}{r['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
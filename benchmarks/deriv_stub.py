@@ -0,0 +1,93 @@
+"""
+A local stand-in for the Deriv websocket API, for benchmarks.
+
+Answers authorize, balance and balance subscriptions after a fixed latency.
+Tokens starting with "bad" are rejected as invalid. Point the app at it with
+DERIV_ENDPOINT=ws://127.0.0.1:<port>.
+
+Usage:
+    python -m benchmarks.deriv_stub --port 8765 --latency-ms 20
+"""
+import argparse
+import asyncio
+import json
+
+import websockets
+
+
+class DerivStub:
+    """
+    Websocket server speaking the subset of the Deriv API the app uses.
+    """
+
+    def __init__(self, latency=0.02, balance=1000.0):
+        self.latency = latency
+        self.balance = balance
+        self.connections = 0
+        self.requests = 0
+
+    async def handler(self, websocket, *args):
+        self.connections += 1
+        try:
+            await self._serve_connection(websocket)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def _serve_connection(self, websocket):
+        loginids = []
+        async for message in websocket:
+            request = json.loads(message)
+            self.requests += 1
+            await asyncio.sleep(self.latency)
+            reply = {'echo_req': request, 'req_id': request.get('req_id')}
+            if 'authorize' in request:
+                tokens = [request['authorize']] + request.get('tokens', [])
+                reply['msg_type'] = 'authorize'
+                if any(token.startswith('bad') for token in tokens):
+                    reply['error'] = {'code': 'InvalidToken', 'message': 'The token is invalid.'}
+                else:
+                    loginids = [f"CR{abs(hash(token)) % 10 ** 7}" for token in tokens]
+                    reply['authorize'] = {
+                        'loginid': loginids[0], 'balance': self.balance, 'currency': 'USD',
+                        'account_list': [{'loginid': loginid} for loginid in loginids],
+                    }
+            elif 'balance' in request:
+                reply['msg_type'] = 'balance'
+                if not loginids:
+                    reply['error'] = {'code': 'AuthorizationRequired', 'message': 'Please log in.'}
+                else:
+                    reply['balance'] = {'balance': self.balance, 'currency': 'USD', 'loginid': loginids[0]}
+                    if request.get('subscribe'):
+                        reply['subscription'] = {'id': 'balance-1'}
+                        reply['balance']['accounts'] = {
+                            loginid: {'balance': self.balance, 'currency': 'USD'} for loginid in loginids
+                        }
+            else:
+                reply['msg_type'] = next(iter(request))
+                reply['error'] = {'code': 'UnrecognisedRequest', 'message': 'Not supported by the stub.'}
+            await websocket.send(json.dumps(reply))
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        return await websockets.serve(self.handler, host, port)
+
+
+async def _serve_forever(port, latency):
+    stub = DerivStub(latency=latency)
+    await stub.serve(port=port)
+    print(f"Deriv stub listening on ws://127.0.0.1:{port} ({latency * 1000:.0f} ms latency)", flush=True)
+    await asyncio.Future()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve_forever(args.port, args.latency_ms / 1000))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
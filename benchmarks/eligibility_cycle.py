@@ -0,0 +1,149 @@
+"""
+Benchmark one auto_trading_monitor cycle before and after the set-based rewrite.
+
+The legacy cycle issues one join plus two SUM(profit_loss) queries per trading
+user; the current cycle issues one grouped query. A simulated client adds a
+fixed round-trip latency to every call so the growth with user count is visible
+without a ClickHouse server. Both cycles and both limit evaluations read the
+same synthetic users (benchmarks/fakes.py).
+
+Usage:
+    python -m benchmarks.eligibility_cycle --users 100 500 1000 2000 --latency-ms 1
+"""
+import argparse
+import contextlib
+import io
+import time
+from datetime import date
+
+from forex.clickhouse.user_eligibility_checker import evaluate_limits, run_eligibility_check
+
+from .fakes import FakeClickHouse, _Result
+
+
+class LegacyClickHouse(FakeClickHouse):
+    """
+    FakeClickHouse that also answers the per-user queries of the legacy cycle, from the same users.
+    """
+
+    def __init__(self, users, latency=0.0, seed=42):
+        super().__init__(users, latency, seed)
+        self.positions = {email: i for i, email in enumerate(self.emails)}
+
+    def query(self, sql, parameters=None, settings=None):
+        if 'FROM userdetails AS u' in sql:
+            self._round_trip()
+            self.queries += 1
+            frame = self._limits_frame(range(len(self.emails)))
+            return _Result([
+                (row.email, 'token', row.balance, row.balance, 1, 5, row.loss_per_day, row.overall_loss,
+                 row.win_per_day, row.overall_win, row.start_date)
+                for row in frame.itertuples(index=False)
+            ])
+        if 'SUM(profit_loss)' in sql:
+            self._round_trip()
+            self.queries += 1
+            user = self.positions[sql.split("email = '")[1].split("'")[0]]
+            daily = "DATE(timestamp) = '" in sql
+            return _Result([(self.daily_pl[user] if daily else self.overall_pl[user],)])
+        return super().query(sql, parameters, settings)
+
+
+# Columns of the limit frame read by legacy_evaluate, in its unpacking order
+LEGACY_COLUMNS = [
+    'email', 'balance', 'trading_today', 'loss_per_day', 'overall_loss', 'win_per_day', 'overall_win',
+    'daily_profit_loss', 'overall_profit_loss',
+]
+
+
+def legacy_evaluate(rows):
+    """
+    Per-row Python limit checks, as done before evaluate_limits was vectorized,
+    with the same trading_today check so both sides do the same work.
+    """
+    daily, overall = [], []
+    for (email, balance, trading_today, loss_per_day, overall_loss, win_per_day, overall_win,
+         daily_pl, overall_pl) in rows:
+        if trading_today and (
+            daily_pl <= -abs(loss_per_day * balance / 100) or daily_pl >= abs(win_per_day * balance / 100)
+        ):
+            daily.append(email)
+        if overall_pl <= -abs(overall_loss * balance / 100) or overall_pl >= abs(overall_win * balance / 100):
+            overall.append(email)
+    return daily, overall
+
+
+def legacy_cycle(client, today_date):
+    """
+    The per-user N+1 implementation this benchmark compares against.
+    """
+    user_query = client.query("""
+        SELECT u.email, u.token, u.balance, u.balance_today,
+               r.per_trade, r.per_day,
+               s.loss_per_day, s.overall_loss, s.win_per_day, s.overall_win, s.start_date
+        FROM userdetails AS u
+        JOIN risk_table AS r ON u.email = r.email
+        JOIN start_stop_table AS s ON u.email = s.email
+        WHERE u.trading = '1'
+    """)
+    for row in user_query.result_set:
+        email, token, balance, balance_today, per_trade, per_day, loss_per_day, overall_loss, win_per_day, overall_win, start_date = row
+        start_date_str = start_date.strftime('%Y-%m-%d')
+        profit_loss_query = client.query(f"""
+            SELECT SUM(profit_loss)
+            FROM trades
+            WHERE email = '{email}' AND DATE(timestamp) >= '{start_date_str}' AND DATE(timestamp) = '{today_date}'
+        """)
+        total_profit_loss = profit_loss_query.result_set[0][0] or 0
+        if total_profit_loss <= -abs(loss_per_day * balance / 100) or total_profit_loss >= abs(win_per_day * balance / 100):
+            client.command(f"ALTER TABLE userdetails UPDATE trading_today = false WHERE email = '{email}'")
+        overall_profit_loss_query = client.query(f"""
+            SELECT SUM(profit_loss)
+            FROM trades
+            WHERE email = '{email}' AND DATE(timestamp) >= '{start_date_str}'
+        """)
+        total_overall_profit_loss = overall_profit_loss_query.result_set[0][0] or 0
+        if total_overall_profit_loss <= -abs(overall_loss * balance / 100) or total_overall_profit_loss >= abs(overall_win * balance / 100):
+            client.command(f"ALTER TABLE userdetails UPDATE trading = false, trading_today = false WHERE email = '{email}'")
+
+
+def _measure(cycle, users, latency):
+    client = LegacyClickHouse(users, latency)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        cycle(client, date.today())
+    return time.perf_counter() - started, client.queries, client.commands + client.inserts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, nargs='+', default=[100, 500, 1000, 2000])
+    parser.add_argument('--latency-ms', type=float, default=1.0, help='simulated round trip per call')
+    parser.add_argument('--evaluate', type=int, nargs='+', default=[10000, 100000],
+                        help='account counts for the limit-evaluation CPU comparison')
+    args = parser.parse_args()
+    latency = args.latency_ms / 1000
+
+    print(f"{'users':>8} {'impl':>8} {'seconds':>10} {'queries':>8} {'writes':>10}")
+    for users in args.users:
+        for name, cycle in (('legacy', legacy_cycle), ('grouped', run_eligibility_check)):
+            seconds, queries, commands = _measure(cycle, users, latency)
+            print(f"{users:>8} {name:>8} {seconds:>10.3f} {queries:>8} {commands:>10}")
+
+    print()
+    print(f"{'accounts':>8} {'per-row ms':>12} {'vectorized ms':>14}")
+    for users in args.evaluate:
+        client = FakeClickHouse(users)
+        frame = client._limits_frame(range(users))
+        rows = list(frame[LEGACY_COLUMNS].itertuples(index=False, name=None))
+        started = time.perf_counter()
+        legacy_evaluate(rows)
+        per_row = time.perf_counter() - started
+        started = time.perf_counter()
+        evaluate_limits(frame)
+        vectorized = time.perf_counter() - started
+        print(f"{users:>8} {per_row * 1000:>12.1f} {vectorized * 1000:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+In-process stand-ins for ClickHouse and the Deriv API, for benchmarks.
+
+FakeClickHouse answers the reads the background jobs make from a synthetic
+user population and counts every call; FakeDerivAPI answers authorize and
+balance. Both sleep a configurable latency per call to model round trips.
+"""
+import asyncio
+import bisect
+import contextlib
+import random
+import re
+import time
+from datetime import datetime
+
+import pandas as pd
+
+_LIMIT = re.compile(r"LIMIT (\d+)")
+_SHARD = re.compile(r"modulo\(cityHash64\([\w.]*email\), (\d+)\) = (\d+)")
+
+
+class _Result:
+    def __init__(self, rows):
+        self.result_set = rows
+
+
+class FakeClickHouse:
+    """
+    A clickhouse_connect-like client over `users` synthetic trading users.
+
+    `queries` counts reads, `commands` server-side statements (INSERT ...
+    SELECT, ALTER) and `inserts` client-side inserts, with `rows_written`
+    the rows those inserts carried. Shard conditions are honoured, with the
+    user's position standing in for the email hash.
+    """
+
+    def __init__(self, users, latency=0.0, seed=42):
+        self.latency = latency
+        self.queries = 0
+        self.commands = 0
+        self.inserts = 0
+        self.rows_written = 0
+        rng = random.Random(seed)
+        self.emails = [f'user{i}@example.com' for i in range(users)]
+        self.tokens = [f'token-{i}' for i in range(users)]
+        self.daily_pl = [rng.uniform(-80, 120) for _ in range(users)]
+        self.overall_pl = [rng.uniform(-250, 600) for _ in range(users)]
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    @staticmethod
+    def _blocks(users, settings):
+        size = (settings or {}).get('max_block_size', 65536)
+        return [users[start:start + size] for start in range(0, len(users), size)]
+
+    def _users(self, sql):
+        """
+        Positions of the users selected by the query's shard condition, if any.
+        """
+        match = _SHARD.search(sql)
+        if match is None:
+            return range(len(self.emails))
+        count, index = int(match.group(1)), int(match.group(2))
+        return range(index, len(self.emails), count)
+
+    def _limits_frame(self, users):
+        n = len(users)
+        return pd.DataFrame({
+            'email': [self.emails[i] for i in users],
+            'balance': [1000.0] * n,
+            'trading_today': [1] * n,
+            'loss_per_day': [5.0] * n,
+            'overall_loss': [20.0] * n,
+            'win_per_day': [10.0] * n,
+            'overall_win': [50.0] * n,
+            'start_date': [datetime(2025, 1, 1)] * n,
+            'daily_profit_loss': [self.daily_pl[i] for i in users],
+            'overall_profit_loss': [self.overall_pl[i] for i in users],
+        })
+
+    def _users_frame(self, users):
+        return pd.DataFrame({
+            'email': [self.emails[i] for i in users],
+            'balance': [1000.0] * len(users),
+            'trading_today': [1] * len(users),
+        })
+
+    def _pnl_frame(self, users):
+        # Every user starts on the one start date, so all P&L is in segment 1
+        return pd.DataFrame({
+            'email': [self.emails[i] for i in users],
+            'segment': [1] * len(users),
+            'daily_profit_loss': [self.daily_pl[i] for i in users],
+            'overall_profit_loss': [self.overall_pl[i] for i in users],
+        })
+
+    def _config_row(self, table, email):
+        # Settings are the same for every user, so is each table's row hash
+        if table == 'risk_table':
+            return (email, 1, 1.0, 5.0)
+        return (email, 2, datetime(2025, 1, 1), datetime(2030, 1, 1), 5.0, 20.0, 10.0, 50.0)
+
+    def query_row_block_stream(self, sql, parameters=None, settings=None):
+        self._round_trip()
+        self.queries += 1
+        users = self._users(sql)
+        if 'SELECT token, email' in sql:
+            rows = [(self.tokens[i], self.emails[i]) for i in users]
+        elif 'SELECT email, cityHash64' in sql:
+            table = 'risk_table' if 'risk_table' in sql else 'start_stop_table'
+            rows = [self._config_row(table, self.emails[i])[:2] for i in users]
+        else:
+            raise NotImplementedError(f"FakeClickHouse has no data for: {sql.strip()[:80]}")
+        return contextlib.nullcontext(iter(self._blocks(rows, settings)))
+
+    def query_df_stream(self, sql, parameters=None, settings=None):
+        self._round_trip()
+        self.queries += 1
+        if 'AS segment' in sql:
+            make_frame = self._pnl_frame
+        elif 'daily_profit_loss' in sql:
+            make_frame = self._limits_frame
+        elif 'FROM userdetails_current' in sql:
+            make_frame = self._users_frame
+        else:
+            raise NotImplementedError(f"FakeClickHouse has no data for: {sql.strip()[:80]}")
+        frames = (make_frame(users) for users in self._blocks(self._users(sql), settings))
+        return contextlib.nullcontext(frames)
+
+    def query(self, sql, parameters=None, settings=None):
+        self._round_trip()
+        self.queries += 1
+        if 'FROM system.parts' in sql:
+            # Config tables that never change
+            return _Result([('risk_table', datetime(2025, 1, 1), len(self.emails)),
+                            ('start_stop_table', datetime(2025, 1, 1), len(self.emails))])
+        if 'FROM userdetails' in sql and 'email > %(last)s' in sql:
+            # Keyset pages of (email, token) in email order
+            limit = int(_LIMIT.search(sql).group(1))
+            rows = sorted((self.emails[i], self.tokens[i]) for i in self._users(sql))
+            start = bisect.bisect_right(rows, (parameters['last'], chr(0x10FFFF)))
+            return _Result(rows[start:start + limit])
+        if 'WHERE email IN' in sql:
+            table = 'risk_table' if 'FROM risk_table' in sql else 'start_stop_table'
+            return _Result([self._config_row(table, email) for email in parameters['emails']])
+        return _Result([])
+
+    def command(self, sql, parameters=None, settings=None):
+        self._round_trip()
+        self.commands += 1
+
+    def insert(self, table, data, column_names=None, settings=None):
+        self._round_trip()
+        self.inserts += 1
+        self.rows_written += len(data)
+
+    def ping(self):
+        return True
+
+
+class FakeDerivAPI:
+    """
+    Answers authorize and balance like DerivAPI, after `latency` seconds each.
+    """
+
+    calls = 0
+
+    def __init__(self, latency=0.0, balance=1000.0):
+        self.latency = latency
+        self._balance = balance
+        self._loginid = None
+
+    async def _round_trip(self):
+        FakeDerivAPI.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def authorize(self, token):
+        await self._round_trip()
+        self._loginid = f"CR{token.rsplit('-', 1)[-1]}"
+        return {'authorize': {'loginid': self._loginid, 'balance': self._balance}, 'msg_type': 'authorize'}
+
+    async def balance(self, args=None):
+        await self._round_trip()
+        return {'balance': {'balance': self._balance, 'loginid': self._loginid}, 'msg_type': 'balance'}
+
+    async def disconnect(self):
+        pass
@@ -0,0 +1,84 @@
+"""
+Check that importing the project stays fast and does not touch the network.
+
+Each step runs in a fresh interpreter with CLICKHOUSE_HOST pointed at an
+unroutable address, so an import that connects to ClickHouse shows up as a
+connect timeout rather than passing quietly. Exits with status 1 when a step
+is over its budget, so it can run in CI.
+
+Usage:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --package-budget-ms 50 --setup-budget-ms 4000
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Default budgets in milliseconds, also enforced by forex/tests.py
+PACKAGE_BUDGET_MS = 50
+SETUP_BUDGET_MS = 4000
+
+STEPS = [
+    ('import forex', 'package', "import forex"),
+    ('django.setup() + URLconf', 'setup', (
+        "import os, django\n"
+        "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'forex.settings')\n"
+        "django.setup()\n"
+        "import forex.urls\n"
+    )),
+]
+
+_TIMED = """
+import time
+started = time.perf_counter()
+{code}
+print(time.perf_counter() - started)
+"""
+
+
+def time_import(code, timeout):
+    """
+    Seconds `code` takes in a fresh interpreter; None if it timed out, raises if it failed.
+    """
+    env = dict(os.environ, CLICKHOUSE_HOST='10.255.255.1', CLICKHOUSE_CONNECT_TIMEOUT='30')
+    try:
+        result = subprocess.run(
+            [sys.executable, '-c', _TIMED.format(code=code)],
+            env=env, capture_output=True, text=True, timeout=timeout, check=True,
+        )
+    except subprocess.TimeoutExpired:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--package-budget-ms', type=float, default=PACKAGE_BUDGET_MS)
+    parser.add_argument('--setup-budget-ms', type=float, default=SETUP_BUDGET_MS)
+    args = parser.parse_args()
+    budgets = {'package': args.package_budget_ms, 'setup': args.setup_budget_ms}
+
+    failed = False
+    print(f"{'step':<28}{'ms':>10}{'budget':>10}")
+    for label, kind, code in STEPS:
+        budget = budgets[kind]
+        try:
+            seconds = time_import(code, timeout=max(10, budget / 1000 * 3))
+        except subprocess.CalledProcessError as e:
+            failed = True
+            error = (e.stderr.strip().splitlines() or ['failed'])[-1]
+            print(f"{label:<28}{'error':>10}{budget:>10.0f}  {error}")
+            continue
+        if seconds is None:
+            failed = True
+            print(f"{label:<28}{'timeout':>10}{budget:>10.0f}")
+            continue
+        over = seconds * 1000 > budget
+        failed = failed or over
+        print(f"{label:<28}{seconds * 1000:>10.1f}{budget:>10.0f}{'  OVER BUDGET' if over else ''}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Scaling benchmark for the background jobs.
+
+Runs one cycle of enable_disable_accounts, schedule_sync (a ScheduleRunner
+sync), balance__tracker and auto_trading_monitor against FakeClickHouse and FakeDerivAPI
+(benchmarks/fakes.py) for each population size, and reports wall time,
+ClickHouse reads / statements / inserts, rows written and peak Python memory
+(tracemalloc, measured in a second run so it does not inflate the timing).
+Each cycle starts with an empty config snapshot; --warm runs one unmeasured
+cycle first, to measure the steady state instead. --shards N runs the cycle
+as N shard processes side by side and reports the slowest shard's time and
+the summed counts.
+
+Usage:
+    python -m benchmarks.jobs --users 1000 10000 100000 --clickhouse-latency-ms 2 --deriv-latency-ms 1
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import sys
+import time
+import tracemalloc
+
+import authorise_deriv.deriv_pool as deriv_pool
+import authorise_deriv.resilience as resilience
+import forex.clickhouse.async_client as async_client
+import forex.clickhouse.config_snapshot as config_snapshot
+from forex.clickhouse.sharding import Shard, set_current_shard
+from forex.clickhouse.account_enabler import enable_disable_accounts
+from forex.clickhouse.balance_tracker import balance__tracker
+from forex.clickhouse.schedule_index import ScheduleRunner
+from forex.clickhouse.user_eligibility_checker import auto_trading_monitor
+
+from .fakes import FakeClickHouse, FakeDerivAPI
+
+JOBS = {
+    'enable_disable_accounts': enable_disable_accounts,
+    # A fresh ScheduleRunner per cycle, so --warm measures an incremental sync
+    'schedule_sync': None,
+    'balance__tracker': balance__tracker,
+    'auto_trading_monitor': auto_trading_monitor,
+}
+
+
+class _ErrorLog(logging.Handler):
+    """
+    Collects the warnings and errors the jobs log during a cycle.
+    """
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(record.getMessage())
+
+
+@contextlib.contextmanager
+def captured_errors():
+    logger = logging.getLogger('forex')
+    handler, propagate = _ErrorLog(), logger.propagate
+    logger.addHandler(handler)
+    logger.propagate = False
+    try:
+        yield handler.lines
+    finally:
+        logger.removeHandler(handler)
+        logger.propagate = propagate
+
+
+@contextlib.contextmanager
+def fake_backends(client, deriv_latency, deriv_max_rate=0):
+    """
+    Route the jobs' ClickHouse and Deriv calls to the fakes, with fresh Deriv
+    rate limiter and circuit breaker (no rate limit by default).
+    """
+    get_client, open_api = async_client.get_clickhouse_client, deriv_pool.open_deriv_api
+    get_guards = resilience.get_deriv_guards
+    guards = (resilience.AdaptiveRateLimiter(max_rate=deriv_max_rate), resilience.CircuitBreaker())
+    async_client.get_clickhouse_client = lambda: client
+    deriv_pool.open_deriv_api = lambda app_id: FakeDerivAPI(latency=deriv_latency)
+    deriv_pool.get_deriv_guards = lambda: guards
+    try:
+        yield
+    finally:
+        async_client.get_clickhouse_client, deriv_pool.open_deriv_api = get_client, open_api
+        deriv_pool.get_deriv_guards = get_guards
+
+
+def run_cycle(job, users, clickhouse_latency, deriv_latency, trace_memory=False, warm=False, shard=None):
+    """
+    Run one cycle of `job` over `users` synthetic users and return its measurements.
+    """
+    set_current_shard(shard or Shard())
+    config_snapshot._snapshot = None
+    client = FakeClickHouse(users, latency=clickhouse_latency)
+    func = ScheduleRunner().sync if job == 'schedule_sync' else JOBS[job]
+    with fake_backends(client, deriv_latency), captured_errors() as errors:
+        if warm:
+            asyncio.run(func())
+            client.queries = client.commands = client.inserts = client.rows_written = 0
+        FakeDerivAPI.calls = 0
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            asyncio.run(func())
+        finally:
+            seconds = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+            if trace_memory:
+                tracemalloc.stop()
+    return {
+        'seconds': seconds,
+        'queries': client.queries,
+        'commands': client.commands,
+        'inserts': client.inserts,
+        'rows_written': client.rows_written,
+        'deriv_calls': FakeDerivAPI.calls,
+        'peak_mb': peak / 2 ** 20 if peak is not None else None,
+        'errors': errors,
+    }
+
+
+def _run_shard(arguments):
+    job, users, clickhouse_latency, deriv_latency, trace_memory, warm, shard = arguments
+    return run_cycle(job, users, clickhouse_latency, deriv_latency, trace_memory, warm, shard)
+
+
+def run_sharded_cycle(job, users, clickhouse_latency, deriv_latency, shards, trace_memory=False, warm=False):
+    """
+    Run one cycle of `job` as `shards` concurrent shard processes and combine their measurements.
+    """
+    if shards == 1:
+        return run_cycle(job, users, clickhouse_latency, deriv_latency, trace_memory, warm)
+    arguments = [
+        (job, users, clickhouse_latency, deriv_latency, trace_memory, warm, Shard(index, shards))
+        for index in range(shards)
+    ]
+    with multiprocessing.get_context('fork').Pool(shards) as pool:
+        results = pool.map(_run_shard, arguments)
+    combined = {key: sum(result[key] for result in results)
+                for key in ('queries', 'commands', 'inserts', 'rows_written', 'deriv_calls')}
+    combined['seconds'] = max(result['seconds'] for result in results)
+    combined['peak_mb'] = max(result['peak_mb'] for result in results) if trace_memory else None
+    combined['errors'] = [line for result in results for line in result['errors']]
+    return combined
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--jobs', nargs='+', default=list(JOBS), choices=list(JOBS))
+    parser.add_argument('--clickhouse-latency-ms', type=float, default=2.0)
+    parser.add_argument('--deriv-latency-ms', type=float, default=1.0)
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc run")
+    parser.add_argument('--warm', action='store_true', help="measure a second cycle with a warm config snapshot")
+    parser.add_argument('--shards', type=int, default=1, help="run each cycle as this many shard processes")
+    args = parser.parse_args()
+
+    print(f"{'job':<24}{'users':>8}{'seconds':>10}{'reads':>7}{'stmts':>7}{'inserts':>9}"
+          f"{'rows':>9}{'deriv':>9}{'peak MB':>9}")
+    failed = False
+    for job in args.jobs:
+        for users in args.users:
+            latencies = (args.clickhouse_latency_ms / 1000, args.deriv_latency_ms / 1000)
+            result = run_sharded_cycle(job, users, *latencies, args.shards, warm=args.warm)
+            if not args.no_memory:
+                result['peak_mb'] = run_sharded_cycle(
+                    job, users, *latencies, args.shards, trace_memory=True, warm=args.warm
+                )['peak_mb']
+            peak = f"{result['peak_mb']:.1f}" if result['peak_mb'] is not None else '-'
+            print(f"{job:<24}{users:>8}{result['seconds']:>10.3f}{result['queries']:>7}{result['commands']:>7}"
+                  f"{result['inserts']:>9}{result['rows_written']:>9}{result['deriv_calls']:>9}{peak:>9}")
+            for line in result['errors'][:3]:
+                failed = True
+                print(f"    {line}", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
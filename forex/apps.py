@@ -0,0 +1,28 @@
+import os
+import sys
+
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class ForexConfig(AppConfig):
+    name = 'forex'
+
+    def ready(self):
+        # Off by default: with several gunicorn workers each one would run the
+        # jobs. Meant for single-process setups such as local development.
+        if not getattr(settings, 'FOREX_START_JOBS', False):
+            return
+        # Only serving processes run jobs, not migrate/collectstatic/check or
+        # the parent process of the runserver autoreloader.
+        command = sys.argv[1] if len(sys.argv) > 1 and os.path.basename(sys.argv[0]) == 'manage.py' else None
+        if command is not None and command != 'runserver':
+            return
+        if command == 'runserver' and '--noreload' not in sys.argv and os.environ.get('RUN_MAIN') != 'true':
+            return
+
+        from . import start_candle_fetcher_thread
+        from .clickhouse.job_logging import configure_job_logging
+
+        configure_job_logging()
+        start_candle_fetcher_thread()
@@ -1,74 +1,56 @@
-RED = '\033[91m'
-GREEN = '\033[92m'
-YELLOW = '\033[93m'
-BLUE = '\033[94m'
-RESET = '\033[0m' 
+import logging
+from datetime import datetime, time
 
-from authorise_deriv.views import balance
-import asyncio
-from datetime import datetime
-from .connection import get_clickhouse_client
+from .async_client import get_async_clickhouse_client
+from .config_snapshot import get_config_snapshot
+from .user_state import record_user_state, reset_trading_today
+
+logger = logging.getLogger(__name__)
 
 """
 This method handles stoping and strating of user accounts
 
 when the date they choose to start is today it enables them to start
 and vice versa.
+
+The job runner applies these transitions on time from the schedule index
+(schedule_index.py); this full pass over every schedule is run by
+`python manage.py reconcile_schedules`.
 """
 async def enable_disable_accounts():
-    client = get_clickhouse_client()
+    db = get_async_clickhouse_client()
     today_date = datetime.today().date()
-    print("")
-    print(f"{BLUE}_________________________ENABLING AND DISABLING ACCOUNTS________________________________________________{RESET}")
-    print("")
-    print(f"{BLUE}Running auto_config at {datetime.now()}{RESET}")
-    print("")
+    logger.info("Running enable_disable_accounts", extra={'job': 'enable_disable_accounts'})
 
     try:
-        result = client.query(f"""
-            SELECT email, stop_date, start_date
-            FROM start_stop_table
-        """)
-
-        # print(f"Query result: {result.result_set}")  # Debugging
-
-        for row in result.result_set:
-            email, stop_date, start_date = row[0], row[1], row[2]
-
-            # Ensure date comparison works
-            stop_date = stop_date.date() if isinstance(stop_date, datetime) else stop_date
-            start_date = start_date.date() if isinstance(start_date, datetime) else start_date
-
-            if stop_date <= today_date:
-                trading = 'false'
-                print(f"{GREEN}Disabling trading for {email}{RESET }")
-                client.command(f"""
-                    ALTER TABLE userdetails UPDATE trading_today = {trading}, trading = {trading}
-                    WHERE email = '{email}'
-                """)
-            elif start_date == today_date:
-                trading = 'true'
-                print(f"{GREEN}Enabling trading for {email}{RESET }")
-                client.command(f"""
-                    ALTER TABLE userdetails UPDATE trading_today = {trading}, trading = {trading}
-                    WHERE email = '{email}'
-                """)
-            else:
-                print(f"No update needed for {email}")
-
-        # Resume trading for all eligible users
-        print(f"{YELLOW}Resuming trading for all eligible users{RESET}")
-        trading = 'true'
-        client.command(f"""
-            ALTER TABLE userdetails UPDATE trading_today ={trading}
-            WHERE trading = '1'
-        """)
-
-    except Exception as e:
-        print(f"Error running auto_config: {e}")
+        # Start/stop dates come from the in-memory config snapshot, which only
+        # re-reads start_stop_table when it changed. Each state change is one
+        # user_trading_state insert however many accounts it covers.
+        client = await db.client()
+        snapshot = get_config_snapshot()
+        await db.run(snapshot.refresh, client)
+
+        stopped = snapshot.emails_where(
+            lambda c: c.has_schedule and c.stop_date is not None and c.stop_date <= today_date
+        )
+        await db.run(record_user_state, client, stopped, trading=False, trading_today=False)
+        logger.info("Disabled trading for %d account(s) whose stop date has been reached", len(stopped),
+                    extra={'job': 'enable_disable_accounts', 'stopped': len(stopped)})
+
+        starting = snapshot.emails_where(
+            lambda c: c.has_schedule and c.start_date == today_date
+            and c.stop_date is not None and c.stop_date > today_date
+        )
+        await db.run(record_user_state, client, starting, trading=True, trading_today=True)
+        logger.info("Enabled trading for %d account(s) starting today", len(starting),
+                    extra={'job': 'enable_disable_accounts', 'starting': len(starting)})
+
+        # Resume trading for all eligible users, except those stopped for
+        # today (a daily limit) since midnight
+        await db.run(reset_trading_today, client, datetime.combine(today_date, time.min))
+
+        logger.info("Resumed trading for all eligible users", extra={'job': 'enable_disable_accounts'})
+
+    except Exception:
+        logger.exception("Error running enable_disable_accounts", extra={'job': 'enable_disable_accounts'})
         raise
-
-    # Sleep before rerunning
-    print(f"{BLUE}Sleeping for 24 hours...{RESET}")
-    await asyncio.sleep(60 * 60 * 24)
-    await auto_config()
@@ -0,0 +1,126 @@
+"""
+Non-blocking ClickHouse access for the async jobs.
+
+clickhouse_connect is synchronous, so every query made directly from a job
+blocks the event loop, and with it every other job and Deriv websocket. The
+jobs go through AsyncClickHouseClient instead: the same query / query_df /
+command / insert calls, plus async versions of the block iterators, each run
+on a thread pool of CLICKHOUSE_ASYNC_WORKERS threads (default: the HTTP pool
+size, so a worker never waits for a connection).
+
+Cancelling an awaiting job does not stop a query that has already started
+in a worker thread; the server-side max_execution_time still bounds it.
+"""
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .connection import CLICKHOUSE_POOL_SIZE, get_clickhouse_client
+from .streaming import CLICKHOUSE_STREAM_BLOCK_SIZE, iter_df_blocks, iter_row_blocks, keyset_page_query
+
+CLICKHOUSE_ASYNC_WORKERS = int(os.getenv('CLICKHOUSE_ASYNC_WORKERS', str(CLICKHOUSE_POOL_SIZE)))
+
+_lock = threading.Lock()
+_async_client = None
+_async_client_pid = None
+
+_DONE = object()
+
+
+class AsyncClickHouseClient:
+    """
+    Awaitable wrappers around the shared ClickHouse client, run on a bounded executor.
+    """
+
+    def __init__(self, max_workers=CLICKHOUSE_ASYNC_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='clickhouse')
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run any blocking ClickHouse work, e.g. run(record_user_state, client, emails, ...).
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def client(self):
+        """
+        The shared synchronous client; getting it may reconnect, so that runs off the loop too.
+        """
+        return await self.run(get_clickhouse_client)
+
+    def _call(self, method, *args, **kwargs):
+        return getattr(get_clickhouse_client(), method)(*args, **kwargs)
+
+    async def query(self, *args, **kwargs):
+        return await self.run(self._call, 'query', *args, **kwargs)
+
+    async def query_df(self, *args, **kwargs):
+        return await self.run(self._call, 'query_df', *args, **kwargs)
+
+    async def command(self, *args, **kwargs):
+        return await self.run(self._call, 'command', *args, **kwargs)
+
+    async def insert(self, *args, **kwargs):
+        return await self.run(self._call, 'insert', *args, **kwargs)
+
+    async def _iterate(self, blocks):
+        try:
+            while True:
+                block = await self.run(next, blocks, _DONE)
+                if block is _DONE:
+                    return
+                yield block
+        finally:
+            # Closes the HTTP response if the caller stops early
+            await self.run(blocks.close)
+
+    async def iter_row_blocks(self, sql, parameters=None, settings=None, block_size=None):
+        """
+        Async version of streaming.iter_row_blocks; each block is read in a worker thread.
+        """
+        client = await self.client()
+        async for block in self._iterate(iter_row_blocks(client, sql, parameters, settings, block_size)):
+            yield block
+
+    async def iter_df_blocks(self, sql, parameters=None, settings=None, block_size=None):
+        """
+        Async version of streaming.iter_df_blocks; each block is read in a worker thread.
+        """
+        client = await self.client()
+        async for frame in self._iterate(iter_df_blocks(client, sql, parameters, settings, block_size)):
+            yield frame
+
+    async def iter_keyset_pages(self, select, table, key, where='1', parameters=None, page_size=None):
+        """
+        Yield the rows of `table` as lists of row tuples, one keyset-paginated
+        query per page (streaming.keyset_page_query); no query stays open while
+        the caller works on a page.
+        """
+        page_size = page_size or CLICKHOUSE_STREAM_BLOCK_SIZE
+        sql = keyset_page_query(select, table, key, where, page_size)
+        last = ''
+        while True:
+            rows = (await self.query(sql, parameters={**(parameters or {}), 'last': last})).result_set
+            if rows:
+                yield rows
+            if len(rows) < page_size:
+                return
+            last = rows[-1][0]
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def get_async_clickhouse_client():
+    """
+    Return the process-wide async client.
+    """
+    global _async_client, _async_client_pid
+    with _lock:
+        # Executor threads do not survive a fork
+        if _async_client is None or _async_client_pid != os.getpid():
+            _async_client = AsyncClickHouseClient()
+            _async_client_pid = os.getpid()
+        return _async_client
@@ -0,0 +1,94 @@
+"""
+Per-user balance history queries over the balances table and its rollups.
+
+Every resolution returns the same columns, one row per bucket:
+(bucket, open_balance, close_balance, min_balance, max_balance, samples).
+"""
+from datetime import datetime, timedelta
+
+from .schema import BALANCE_HOURLY_RETENTION_DAYS, BALANCE_RETENTION_DAYS
+
+RESOLUTIONS = ('raw', 'hour', 'day')
+
+# balance__tracker samples every 2 hours
+RAW_SAMPLE_INTERVAL = timedelta(hours=2)
+_BUCKET = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+
+# Default upper bound on the number of points a range should return
+MAX_POINTS = 1000
+
+_RAW_SQL = """
+    SELECT timestamp AS bucket,
+           balance AS open_balance, balance AS close_balance,
+           balance AS min_balance, balance AS max_balance,
+           toUInt64(1) AS samples
+    FROM balances
+    WHERE email = %(email)s AND timestamp >= %(start)s AND timestamp < %(end)s
+    ORDER BY timestamp
+"""
+
+_ROLLUP_SQL = """
+    SELECT bucket,
+           argMinMerge(open_balance) AS open_balance,
+           argMaxMerge(close_balance) AS close_balance,
+           min(min_balance) AS min_balance,
+           max(max_balance) AS max_balance,
+           sum(samples) AS samples
+    FROM {table}
+    WHERE email = %(email)s AND bucket >= {bucket}(toDateTime(%(start)s)) AND bucket < %(end)s
+    GROUP BY bucket
+    ORDER BY bucket
+"""
+
+
+def _covered(resolution, start, now):
+    """
+    Whether `resolution` still has data at `start` given its retention.
+    """
+    days = {'raw': BALANCE_RETENTION_DAYS, 'hour': BALANCE_HOURLY_RETENTION_DAYS}.get(resolution, 0)
+    return not days or start >= now - timedelta(days=days)
+
+
+def pick_resolution(start, end, resolution=None, max_points=MAX_POINTS, now=None):
+    """
+    Choose the table to read for a range.
+
+    An explicit `resolution` is honoured unless that table no longer holds
+    data for `start`. Otherwise the finest resolution that returns at most
+    `max_points` points is used.
+    """
+    now = now or datetime.now()
+    if resolution is not None and resolution not in RESOLUTIONS:
+        raise ValueError(f"resolution must be one of {', '.join(RESOLUTIONS)}")
+
+    candidates = RESOLUTIONS[RESOLUTIONS.index(resolution):] if resolution else RESOLUTIONS
+    for candidate in candidates:
+        if not _covered(candidate, start, now):
+            continue
+        step = RAW_SAMPLE_INTERVAL if candidate == 'raw' else _BUCKET[candidate]
+        if resolution or (end - start) / step <= max_points:
+            return candidate
+    return 'day'
+
+
+def history_query(email, start, end, resolution):
+    """
+    Return (sql, parameters) reading one user's history at `resolution`.
+    """
+    parameters = {'email': email, 'start': start, 'end': end}
+    if resolution == 'raw':
+        return _RAW_SQL, parameters
+    if resolution == 'hour':
+        return _ROLLUP_SQL.format(table='balances_hourly', bucket='toStartOfHour'), parameters
+    if resolution == 'day':
+        return _ROLLUP_SQL.format(table='balances_daily', bucket='toStartOfDay'), parameters
+    raise ValueError(f"resolution must be one of {', '.join(RESOLUTIONS)}")
+
+
+def balance_history(client, email, start, end, resolution=None, max_points=MAX_POINTS):
+    """
+    Return (resolution, rows) for `email` between `start` (inclusive) and `end` (exclusive).
+    """
+    resolution = pick_resolution(start, end, resolution, max_points)
+    sql, parameters = history_query(email, start, end, resolution)
+    return resolution, client.query(sql, parameters=parameters).result_set
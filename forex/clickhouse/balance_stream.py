@@ -0,0 +1,212 @@
+"""
+Push-based balance tracking over long-lived Deriv balance subscriptions.
+
+Instead of polling every account every 2 hours, the stream keeps Deriv
+websockets open and subscribes to balance updates for every trading account.
+Tokens are grouped onto shared connections: the first token of a group
+authorizes the connection, the rest are passed as additional `tokens`, and
+one `balance` subscription with `account: all` then delivers updates for
+every account in the group, identified by loginid. Deriv only accepts extra
+tokens in some cases; a group it rejects is split into single-token
+connections.
+
+Updates are coalesced in memory (latest balance per email) and written
+periodically as one batch of balances samples plus balance_today state
+rows. Two scheduler jobs drive it: sync() reconciles subscriptions with the
+current set of trading accounts and reopens dead connections, and flush()
+writes the coalesced updates.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from authorise_deriv.deriv_pool import DerivConnectionPool, guarded_call, open_deriv_api
+from authorise_deriv.resilience import CircuitOpenError
+from authorise_deriv.views import app_id
+
+from .async_client import get_async_clickhouse_client
+from .insert_buffer import InsertBuffer
+from .metrics import DERIV_ERRORS
+from .sharding import shard_condition
+from .user_state import STATE_COLUMNS, state_rows
+
+logger = logging.getLogger(__name__)
+
+# How many accounts share one websocket, and how often the account set is
+# reconciled and coalesced balances are written (seconds).
+DERIV_STREAM_TOKENS_PER_CONNECTION = int(os.getenv('DERIV_STREAM_TOKENS_PER_CONNECTION', '20'))
+BALANCE_STREAM_SYNC_INTERVAL = int(os.getenv('BALANCE_STREAM_SYNC_INTERVAL', '300'))
+BALANCE_STREAM_FLUSH_INTERVAL = int(os.getenv('BALANCE_STREAM_FLUSH_INTERVAL', '60'))
+
+
+class _SubscriptionGroup:
+    """
+    One websocket carrying the balance subscription for a group of tokens.
+    """
+
+    def __init__(self, tokens, on_update):
+        self.tokens = list(tokens)
+        self.on_update = on_update
+        self.api = None
+        self.alive = False
+
+    async def open(self):
+        self.api = open_deriv_api(app_id)
+        request = {'authorize': self.tokens[0]}
+        if len(self.tokens) > 1:
+            request['tokens'] = self.tokens[1:]
+        # Through the shared rate limiter and circuit breaker, like every other Deriv call
+        # (the generated authorize() call does not know the `tokens` field yet)
+        await guarded_call('authorize', lambda: self.api.send(request))
+        source = await guarded_call(
+            'subscribe', lambda: self.api.subscribe({'balance': 1, 'account': 'all', 'subscribe': 1})
+        )
+        source.subscribe(on_next=self._on_next, on_error=self._on_error)
+        self.alive = True
+
+    def _on_next(self, response):
+        update = response.get('balance') or {}
+        if 'loginid' in update and 'balance' in update:
+            self.on_update(update['loginid'], update['balance'])
+        # With account=all the first message also lists every account
+        for loginid, account in (update.get('accounts') or {}).items():
+            if 'balance' in account:
+                self.on_update(loginid, account['balance'])
+
+    def _on_error(self, error):
+        if not self.alive:
+            return  # closed on purpose
+        self.alive = False
+        DERIV_ERRORS.labels('subscription', 'SubscriptionLost').inc()
+        logger.warning("Balance subscription lost for %d account(s): %s", len(self.tokens), error)
+
+    async def close(self):
+        self.alive = False
+        if self.api is not None:
+            try:
+                await self.api.disconnect()
+            except Exception:
+                pass
+            self.api = None
+
+
+class BalanceStream:
+    """
+    Keeps balance subscriptions for all trading accounts and writes coalesced updates.
+    """
+
+    def __init__(self, tokens_per_connection=DERIV_STREAM_TOKENS_PER_CONNECTION):
+        self.tokens_per_connection = tokens_per_connection
+        self.groups = []
+        self.emails = {}            # token -> email
+        self.loginids = {}          # token -> Deriv loginid
+        self.email_by_loginid = {}  # loginid -> email
+        self._pending = {}          # email -> latest balance since the last flush
+
+    def _on_update(self, loginid, balance):
+        email = self.email_by_loginid.get(loginid)
+        if email is not None:
+            self._pending[email] = balance
+
+    async def _resolve_loginids(self, tokens):
+        """
+        Look up the loginid of new tokens once, so updates can be mapped back to emails.
+        """
+        pool = DerivConnectionPool(app_id)
+        try:
+            async def resolve(token):
+                try:
+                    response = await pool.authorize(token)
+                    self.loginids[token] = response['authorize']['loginid']
+                    self.email_by_loginid[self.loginids[token]] = self.emails[token]
+                except Exception as e:
+                    logger.warning("Could not authorize %s for balance streaming: %s", self.emails[token], e)
+            await asyncio.gather(*(resolve(token) for token in tokens))
+        finally:
+            await pool.close()
+
+    async def _open_group(self, tokens):
+        group = _SubscriptionGroup(tokens, self._on_update)
+        try:
+            await group.open()
+            self.groups.append(group)
+        except CircuitOpenError:
+            # Deriv is failing; the next sync subscribes these accounts
+            await group.close()
+        except Exception as e:
+            await group.close()
+            if len(tokens) == 1:
+                logger.warning("Could not subscribe to balance for %s: %s", self.emails.get(tokens[0]), e)
+                return
+            # Deriv did not accept these tokens together; fall back to one per connection
+            for token in tokens:
+                await self._open_group([token])
+
+    async def sync(self):
+        """
+        Reconcile subscriptions with the current shard's trading accounts in ClickHouse.
+        """
+        db = get_async_clickhouse_client()
+        active = {}
+        async for block in db.iter_row_blocks(
+            f"SELECT token, email FROM userdetails_current WHERE trading = '1' AND {shard_condition()}"
+        ):
+            active.update(block)
+
+        # Drop groups whose connection died or that hold accounts no longer trading
+        keep = []
+        for group in self.groups:
+            if group.alive and all(token in active for token in group.tokens):
+                keep.append(group)
+            else:
+                await group.close()
+        self.groups = keep
+
+        self.emails = active
+        subscribed = {token for group in self.groups for token in group.tokens}
+        new_tokens = [token for token in active if token not in self.loginids]
+        if new_tokens:
+            await self._resolve_loginids(new_tokens)
+
+        missing = [token for token in active if token not in subscribed and token in self.loginids]
+        size = max(1, self.tokens_per_connection)
+        await asyncio.gather(*(
+            self._open_group(missing[i:i + size]) for i in range(0, len(missing), size)
+        ))
+        logger.info("Balance stream: %d trading account(s) on %d connection(s)", len(active), len(self.groups),
+                    extra={'accounts': len(active), 'connections': len(self.groups)})
+
+    async def flush(self):
+        """
+        Write the latest balance of every account updated since the last flush.
+        """
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            await self._write(pending)
+        except Exception:
+            # Keep the balances for the next flush; updates received since win
+            for email, balance in pending.items():
+                self._pending.setdefault(email, balance)
+            raise
+        logger.info("Balance stream wrote %d balance update(s)", len(pending), extra={'updates': len(pending)})
+
+    async def _write(self, pending):
+        db = get_async_clickhouse_client()
+        client = await db.client()
+        sampled_at = datetime.now()
+        samples = InsertBuffer(client, 'balances', ['timestamp', 'balance', 'email'], auto_flush=False)
+        states = InsertBuffer(client, 'user_trading_state', STATE_COLUMNS, auto_flush=False)
+        for email, balance in pending.items():
+            samples.add([sampled_at, balance, email])
+            for row in state_rows([email], balance_today=balance):
+                states.add(row)
+        await db.run(samples.flush)
+        await db.run(states.flush)
+
+    async def close(self):
+        for group in self.groups:
+            await group.close()
+        self.groups = []
@@ -1,62 +1,76 @@
-from authorise_deriv.views import balance
-import asyncio
+import logging
+
+from authorise_deriv.views import app_id
+from authorise_deriv.deriv_pool import DerivConnectionPool, fetch_balances
 from datetime import datetime
-from .connection import get_clickhouse_client
+from .async_client import get_async_clickhouse_client
+from .insert_buffer import InsertBuffer
+from .sharding import shard_condition
+from .user_state import STATE_COLUMNS, state_rows
+
+logger = logging.getLogger(__name__)
+
+async def _update_block(db, pool, samples, states, accounts):
+    """
+    Fetch balances for one block of token -> email and queue the writes.
+
+    Returns the number of balances fetched and the number that failed.
+    """
+    balances, failures = await fetch_balances(list(accounts), app_id, pool=pool)
+
+    if failures:
+        # One line per block: while Deriv is down every account in it fails the same way
+        token, error = next(iter(failures.items()))
+        logger.warning("Could not fetch %d balance(s), e.g. for %s: %s", len(failures), accounts[token], error,
+                       extra={'job': 'balance__tracker', 'failed': len(failures)})
+        if logger.isEnabledFor(logging.DEBUG):
+            for token, error in failures.items():
+                logger.debug("Could not fetch balance for %s: %s", accounts[token], error)
+
+    sampled_at = datetime.now()
+    debug = logger.isEnabledFor(logging.DEBUG)
+    for token, account_balance in balances.items():
+        email = accounts[token]
+        if debug:
+            logger.debug("Updating balance for %s = %s", email, account_balance)
+        samples.add([sampled_at, account_balance, email])
+        for row in state_rows([email], balance_today=account_balance):
+            states.add(row)
+
+    for buffer in (samples, states):
+        if buffer.due:
+            await db.run(buffer.flush)
+    return len(balances), len(failures)
 
-RED = '\033[91m'
-GREEN = '\033[92m'
-YELLOW = '\033[93m'
-BLUE = '\033[94m'
-RESET = '\033[0m' 
 
 async def balance__tracker():
-    client = get_clickhouse_client()
+    db = get_async_clickhouse_client()
+    client = await db.client()
 
-    print("")
-    print(f"{BLUE}___________________________________ BALANCE TRACKER____________________________________{RESET}")
-    print("")
-    print(f"{BLUE}Running balance__tracker at {datetime.now()}{RESET}")
-    print("")
+    logger.info("Running balance__tracker", extra={'job': 'balance__tracker'})
 
     try:
         
-        # Update balances
-        result1 = client.query(f"""
-            SELECT token, email
-            FROM userdetails
-        """)
-
-        for row in result1.result_set:
-            token, email = row[0], row[1]
-
-            account_balance = await balance(token) 
-            print(f"{BLUE}Updating balance for {email} = {account_balance} {RESET}")
-            client.command(f"""
-                ALTER TABLE userdetails UPDATE balance_today = {account_balance}
-                WHERE token = '{token}'
-            """)
-
-            client.command("""
-                CREATE TABLE IF NOT EXISTS balances (
-                    timestamp DateTime,
-                    balance Float32,
-                    email String
-                ) ENGINE = MergeTree()
-                ORDER BY timestamp
-            """)
-            
-            client.command(f"""
-                INSERT INTO balances (timestamp, balance, email)
-                VALUES (NOW(), {account_balance}, '{email}')
-            """)
-
-        print(f"{GREEN}Successfully updated balances.{RESET}")
-
-    except Exception as e:
-        print(f"{RED}Error running auto_config: {e}{RESET}")
-        raise
+        # Update balances of this shard's accounts a page at a time. Pages are
+        # separate queries, so no ClickHouse read stays open during Deriv calls
+        pool = DerivConnectionPool(app_id)
+        samples = InsertBuffer(client, 'balances', ['timestamp', 'balance', 'email'], auto_flush=False)
+        states = InsertBuffer(client, 'user_trading_state', STATE_COLUMNS, auto_flush=False)
+        updated = failed = 0
+        try:
+            async for page in db.iter_keyset_pages('email, token', 'userdetails', 'email', where=shard_condition()):
+                accounts = {token: email for email, token in page}
+                fetched, missed = await _update_block(db, pool, samples, states, accounts)
+                updated += fetched
+                failed += missed
+            await db.run(samples.flush)
+            await db.run(states.flush)
+        finally:
+            await pool.close()
 
-    # Sleep for 2 before rerunning
-    print(f"{BLUE}Sleeping for 2 hours...{RESET}")
-    await asyncio.sleep(60 * 60 * 2)
-    await balance__tracker()
+        logger.info("Updated %d balance(s), %d could not be fetched", updated, failed,
+                    extra={'job': 'balance__tracker', 'updated': updated, 'failed': failed})
+
+    except Exception:
+        logger.exception("Error running balance__tracker", extra={'job': 'balance__tracker'})
+        raise
@@ -0,0 +1,213 @@
+"""
+In-memory snapshot of each user's risk and start/stop configuration.
+
+risk_table and start_stop_table rarely change, yet every eligibility cycle
+joined them to userdetails again. The snapshot keeps one compact record per
+user and refreshes it in two steps:
+
+1. A single system.parts query gives each table's latest part modification
+   time and row count. If neither changed since the last refresh, the
+   table is not read at all, which is the steady state.
+2. Otherwise one column of cityHash64 per row is compared with the stored
+   hashes, and only rows that are new or changed are fetched.
+
+Part times have one-second resolution and an in-place ALTER UPDATE keeps the
+row count, so a full hash comparison is also forced every
+CONFIG_SNAPSHOT_MAX_AGE seconds.
+
+Each job runner process keeps only the users of its shard (sharding.py).
+
+The emails changed by recent refreshes are kept per table, so consumers such
+as the schedule index can update themselves from changes_since() instead of
+rescanning every user.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+from .sharding import current_shard
+from .streaming import iter_row_blocks
+
+CONFIG_SNAPSHOT_MAX_AGE = int(os.getenv('CONFIG_SNAPSHOT_MAX_AGE', '3600'))
+
+# table -> (hash slot on UserConfig, columns kept from that table)
+CONFIG_TABLES = {
+    'risk_table': ('risk_hash', ('per_trade', 'per_day')),
+    'start_stop_table': ('schedule_hash', (
+        'start_date', 'stop_date', 'loss_per_day', 'overall_loss', 'win_per_day', 'overall_win',
+    )),
+}
+_DATE_COLUMNS = ('start_date', 'stop_date')
+_FETCH_CHUNK = 1000
+# Refreshes whose changed emails are remembered for changes_since()
+_CHANGE_LOG_SIZE = 64
+
+_lock = threading.Lock()
+_snapshot = None
+_snapshot_pid = None
+
+
+class UserConfig:
+    """
+    Risk and schedule settings of one user.
+    """
+    __slots__ = (
+        'per_trade', 'per_day', 'start_date', 'stop_date',
+        'loss_per_day', 'overall_loss', 'win_per_day', 'overall_win',
+        'risk_hash', 'schedule_hash',
+    )
+
+    def __init__(self):
+        for slot in self.__slots__:
+            setattr(self, slot, None)
+
+    @property
+    def has_risk(self):
+        return self.risk_hash is not None
+
+    @property
+    def has_schedule(self):
+        return self.schedule_hash is not None
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+class ConfigSnapshot:
+    """
+    {email: UserConfig} kept in sync with risk_table and start_stop_table.
+    """
+
+    def __init__(self, max_age=CONFIG_SNAPSHOT_MAX_AGE, shard=None):
+        self.max_age = max_age
+        self.shard = shard or current_shard()
+        self.users = {}
+        self.version = 0
+        self._watermarks = {}
+        self._scanned_at = None
+        self._changes = []  # (version, {table: emails changed})
+        # Several jobs refresh and read the snapshot from executor threads
+        self._lock = threading.Lock()
+
+    def _table_watermarks(self, client):
+        result = client.query(
+            """
+            SELECT table, max(modification_time), sum(rows)
+            FROM system.parts
+            WHERE database = currentDatabase() AND active AND table IN %(tables)s
+            GROUP BY table
+            """,
+            parameters={'tables': tuple(CONFIG_TABLES)},
+        )
+        return {table: (modified, rows) for table, modified, rows in result.result_set}
+
+    def refresh(self, client):
+        """
+        Bring the snapshot up to date; returns the number of users whose records changed.
+        """
+        with self._lock:
+            return self._refresh(client)
+
+    def lookup(self, emails):
+        """
+        The UserConfig of each email, or None for users without one.
+        """
+        with self._lock:
+            return [self.users.get(email) for email in emails]
+
+    def emails_where(self, predicate):
+        """
+        Emails whose UserConfig satisfies `predicate`.
+        """
+        with self._lock:
+            return [email for email, record in self.users.items() if predicate(record)]
+
+    def changes_since(self, version, table):
+        """
+        Emails whose `table` settings changed after snapshot `version`, or None
+        when that version is too old to tell and the caller must rescan.
+        """
+        with self._lock:
+            if version == self.version:
+                return set()
+            if not self._changes or version < self._changes[0][0] - 1:
+                return None
+            emails = set()
+            for changed_version, tables in self._changes:
+                if changed_version > version:
+                    emails.update(tables.get(table, ()))
+            return emails
+
+    def _refresh(self, client):
+        watermarks = self._table_watermarks(client)
+        full_scan = self._scanned_at is None or time.monotonic() - self._scanned_at >= self.max_age
+        changed = {}
+        for table in CONFIG_TABLES:
+            if not full_scan and table in self._watermarks and self._watermarks[table] == watermarks.get(table):
+                continue
+            emails = self._refresh_table(client, table)
+            if emails:
+                changed[table] = emails
+            self._watermarks[table] = watermarks.get(table)
+        if full_scan:
+            self._scanned_at = time.monotonic()
+        if changed:
+            self.version += 1
+            self._changes.append((self.version, changed))
+            del self._changes[:-_CHANGE_LOG_SIZE]
+        return sum(len(emails) for emails in changed.values())
+
+    def _refresh_table(self, client, table):
+        hash_slot, columns = CONFIG_TABLES[table]
+        column_list = ', '.join(columns)
+
+        seen = set()
+        changed = []
+        for block in iter_row_blocks(
+            client, f"SELECT email, cityHash64({column_list}) FROM {table} WHERE {self.shard.condition()}"
+        ):
+            for email, row_hash in block:
+                seen.add(email)
+                record = self.users.get(email)
+                if record is None or getattr(record, hash_slot) != row_hash:
+                    changed.append(email)
+
+        for start in range(0, len(changed), _FETCH_CHUNK):
+            result = client.query(
+                f"SELECT email, cityHash64({column_list}), {column_list} FROM {table} WHERE email IN %(emails)s",
+                parameters={'emails': tuple(changed[start:start + _FETCH_CHUNK])},
+            )
+            for email, row_hash, *values in result.result_set:
+                record = self.users.get(email)
+                if record is None:
+                    record = self.users[email] = UserConfig()
+                setattr(record, hash_slot, row_hash)
+                for column, value in zip(columns, values):
+                    setattr(record, column, _as_date(value) if column in _DATE_COLUMNS else value)
+
+        removed = [
+            email for email, record in self.users.items()
+            if getattr(record, hash_slot) is not None and email not in seen
+        ]
+        for email in removed:
+            record = self.users[email]
+            setattr(record, hash_slot, None)
+            for column in columns:
+                setattr(record, column, None)
+            if not record.has_risk and not record.has_schedule:
+                del self.users[email]
+        return changed + removed
+
+
+def get_config_snapshot():
+    """
+    Return the process-wide snapshot (refresh it before reading).
+    """
+    global _snapshot, _snapshot_pid
+    with _lock:
+        if _snapshot is None or _snapshot_pid != os.getpid():
+            _snapshot = ConfigSnapshot()
+            _snapshot_pid = os.getpid()
+        return _snapshot
@@ -1,15 +1,126 @@
+"""
+Shared ClickHouse client for every job and view in the process.
+
+One HTTP client is created per process on first use and reused afterwards.
+It sits on a keep-alive urllib3 connection pool sized by CLICKHOUSE_POOL_SIZE,
+is safe to share between threads (no server-side session), and is checked
+with a ping at most every CLICKHOUSE_HEALTH_CHECK_INTERVAL seconds so a dead
+connection gets replaced instead of failing every later query. Every call
+on it is timed and counted for the metrics endpoint (metrics.py).
+
+All connection settings are read from the environment. CLICKHOUSE_HOST and
+CLICKHOUSE_PASSWORD have no default; the first client fails without them.
+"""
+import os
+import threading
+import time
+
 import clickhouse_connect
+from clickhouse_connect.driver.httputil import get_pool_manager
+
+from .metrics import InstrumentedClient
 
+CLICKHOUSE_HOST = os.getenv('CLICKHOUSE_HOST')
+CLICKHOUSE_PORT = int(os.getenv('CLICKHOUSE_PORT', '8123'))
+CLICKHOUSE_USER = os.getenv('CLICKHOUSE_USER', 'default')
+CLICKHOUSE_PASSWORD = os.getenv('CLICKHOUSE_PASSWORD')
+CLICKHOUSE_DATABASE = os.getenv('CLICKHOUSE_DATABASE', 'forex_data')
+CLICKHOUSE_SECURE = os.getenv('CLICKHOUSE_SECURE', 'false').lower() in ('1', 'true', 'yes')
+CLICKHOUSE_COMPRESSION = os.getenv('CLICKHOUSE_COMPRESSION', 'lz4')
+CLICKHOUSE_POOL_SIZE = int(os.getenv('CLICKHOUSE_POOL_SIZE', '8'))
+CLICKHOUSE_CONNECT_TIMEOUT = int(os.getenv('CLICKHOUSE_CONNECT_TIMEOUT', '10'))
+CLICKHOUSE_SEND_RECEIVE_TIMEOUT = int(os.getenv('CLICKHOUSE_SEND_RECEIVE_TIMEOUT', '300'))
+# Default server-side limit for a single query, in seconds
+CLICKHOUSE_QUERY_TIMEOUT = int(os.getenv('CLICKHOUSE_QUERY_TIMEOUT', '120'))
+CLICKHOUSE_HEALTH_CHECK_INTERVAL = int(os.getenv('CLICKHOUSE_HEALTH_CHECK_INTERVAL', '30'))
+
+_lock = threading.Lock()
 _clickhouse_client = None
+_client_pid = None
+_last_health_check = 0.0
 
-def get_clickhouse_client():
-    _clickhouse_client = clickhouse_connect.get_client(
-        host='109.74.196.98',
-        port='8123',
-        user='default',
-        password='#00forexd4h',
-        database='forex_data',
-        # secure=True
+
+def _create_client():
+    missing = [
+        name for name, value in (('CLICKHOUSE_HOST', CLICKHOUSE_HOST), ('CLICKHOUSE_PASSWORD', CLICKHOUSE_PASSWORD))
+        if value is None
+    ]
+    if missing:
+        raise RuntimeError(f"Set {' and '.join(missing)} in the environment to connect to ClickHouse")
+    pool_mgr = get_pool_manager(maxsize=CLICKHOUSE_POOL_SIZE, num_pools=1, block=True)
+    client = clickhouse_connect.get_client(
+        host=CLICKHOUSE_HOST,
+        port=CLICKHOUSE_PORT,
+        user=CLICKHOUSE_USER,
+        password=CLICKHOUSE_PASSWORD,
+        database=CLICKHOUSE_DATABASE,
+        secure=CLICKHOUSE_SECURE,
+        compress=CLICKHOUSE_COMPRESSION,
+        connect_timeout=CLICKHOUSE_CONNECT_TIMEOUT,
+        send_receive_timeout=CLICKHOUSE_SEND_RECEIVE_TIMEOUT,
+        settings={'max_execution_time': CLICKHOUSE_QUERY_TIMEOUT},
+        autogenerate_session_id=False,
+        pool_mgr=pool_mgr,
     )
-    return _clickhouse_client
+    return InstrumentedClient(client)
+
+
+def get_clickhouse_client():
+    """
+    Return the process-wide ClickHouse client, connecting or reconnecting as needed.
+    """
+    global _clickhouse_client, _client_pid, _last_health_check
+    with _lock:
+        now = time.monotonic()
+        # A forked worker must not reuse sockets inherited from its parent
+        if _clickhouse_client is not None and _client_pid != os.getpid():
+            _clickhouse_client = None
+        if _clickhouse_client is None:
+            _clickhouse_client = _create_client()
+            _client_pid = os.getpid()
+            _last_health_check = now
+            return _clickhouse_client
+        client = _clickhouse_client
+        check = now - _last_health_check >= CLICKHOUSE_HEALTH_CHECK_INTERVAL
+        if check:
+            # Claim the check, so other threads keep using the client meanwhile
+            _last_health_check = now
+    if not check:
+        return client
+
+    # Ping outside the lock: against an unreachable server it takes the full
+    # connect timeout, and other threads must not queue behind it
+    if client.ping():
+        return client
+    with _lock:
+        if _clickhouse_client is client:
+            _discard(client)
+            _clickhouse_client = None
+    return get_clickhouse_client()
+
+
+def close_clickhouse_client():
+    """
+    Close the shared client; the next call to get_clickhouse_client reconnects.
+    """
+    global _clickhouse_client
+    with _lock:
+        if _clickhouse_client is not None:
+            _discard(_clickhouse_client)
+            _clickhouse_client = None
+
+
+def query_timeout(seconds):
+    """
+    Settings overriding the server-side time limit for one query, e.g.
+    client.query(sql, settings=query_timeout(10)); 0 removes the limit for
+    bulk maintenance statements.
+    """
+    return {'max_execution_time': seconds}
+
 
+def _discard(client):
+    try:
+        client.http.clear()
+    except Exception:
+        pass
@@ -0,0 +1,70 @@
+import threading
+import time
+
+
+class InsertBuffer:
+    """
+    Collects rows for one table and writes them as a single columnar insert.
+
+    ClickHouse creates a new data part for every INSERT, so single-row inserts
+    quickly lead to merge pressure. Rows are held in memory until `flush()` is
+    called, or until `max_rows` rows or `max_age` seconds have accumulated.
+    Wire compression is whatever the client was created with (lz4 by default).
+
+    Async jobs pass auto_flush=False so add() never does I/O on the event
+    loop; they check `due` and run flush() through the async client instead.
+    """
+
+    def __init__(self, client, table, column_names, max_rows=10000, max_age=60, auto_flush=True):
+        self.client = client
+        self.table = table
+        self.column_names = list(column_names)
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.auto_flush = auto_flush
+        self._rows = []
+        self._first_added = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    @property
+    def due(self):
+        """
+        Whether the size or age threshold has been reached.
+        """
+        with self._lock:
+            return bool(self._rows) and (
+                len(self._rows) >= self.max_rows or time.monotonic() - self._first_added >= self.max_age
+            )
+
+    def add(self, row):
+        """
+        Queue one row, flushing if the size or age threshold is reached.
+        """
+        with self._lock:
+            if not self._rows:
+                self._first_added = time.monotonic()
+            self._rows.append(row)
+        if self.auto_flush and self.due:
+            self.flush()
+
+    def flush(self):
+        """
+        Write every queued row in one insert and return the number of rows written.
+        """
+        with self._lock:
+            rows, self._rows = self._rows, []
+            self._first_added = None
+        if not rows:
+            return 0
+        try:
+            self.client.insert(self.table, rows, column_names=self.column_names)
+        except Exception:
+            # Keep the rows so the next flush retries them
+            with self._lock:
+                self._rows = rows + self._rows
+                self._first_added = time.monotonic()
+            raise
+        return len(rows)
@@ -0,0 +1,119 @@
+"""
+Structured, non-blocking logging for the background jobs.
+
+Records from the `forex` and `authorise_deriv` loggers are put on an
+in-memory queue by a QueueHandler and written to stdout by a QueueListener
+thread, so a job never waits on console I/O. Each line is a JSON object
+(FOREX_LOG_FORMAT=json, the default) or plain text (FOREX_LOG_FORMAT=text);
+values passed with `extra=` become fields of the JSON object.
+
+Per-user lines are logged at DEBUG, so they cost nothing at the default
+FOREX_LOG_LEVEL=INFO. A forked process (one per shard) calls
+configure_job_logging again to get its own queue and listener thread, with
+its shard added to every record.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+FOREX_LOG_LEVEL = os.getenv('FOREX_LOG_LEVEL', 'INFO').upper()
+FOREX_LOG_FORMAT = os.getenv('FOREX_LOG_FORMAT', 'json')
+LOGGERS = ('forex', 'authorise_deriv')
+
+# Attributes every LogRecord has; anything else was passed with `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+_listener = None
+_listener_pid = None
+_handlers = []
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record: time, level, logger, message and any extra fields.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _FieldsFilter(logging.Filter):
+    """
+    Adds fixed fields (such as the shard) to every record.
+    """
+
+    def __init__(self, fields):
+        super().__init__()
+        self.fields = fields
+
+    def filter(self, record):
+        for key, value in self.fields.items():
+            setattr(record, key, value)
+        return True
+
+
+def configure_job_logging(level=FOREX_LOG_LEVEL, fmt=FOREX_LOG_FORMAT, stream=None, fields=None):
+    """
+    Route the app's loggers through a queue to stdout; safe to call more than once.
+
+    `fields` are added to every record logged by this process.
+    """
+    global _listener, _listener_pid
+    if _listener is not None and _listener_pid == os.getpid():
+        return _listener
+    # The listener thread of a parent process does not survive a fork
+    for logger, queue_handler in _handlers:
+        logger.removeHandler(queue_handler)
+    _handlers.clear()
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    if fmt == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    records = queue.SimpleQueue()
+    for name in LOGGERS:
+        logger = logging.getLogger(name)
+        logger.setLevel(level)
+        queue_handler = QueueHandler(records)
+        if fields:
+            queue_handler.addFilter(_FieldsFilter(fields))
+        logger.addHandler(queue_handler)
+        logger.propagate = False
+        _handlers.append((logger, queue_handler))
+
+    _listener = QueueListener(records, handler)
+    _listener_pid = os.getpid()
+    _listener.start()
+    # Write out whatever is still queued when the process exits
+    atexit.register(stop_job_logging)
+    return _listener
+
+
+def stop_job_logging():
+    """
+    Write out queued records and stop this process's listener; safe to call more than once.
+    """
+    global _listener
+    listener = _listener
+    if listener is None or _listener_pid != os.getpid():
+        return
+    _listener = None
+    listener.stop()
@@ -0,0 +1,138 @@
+"""
+Leader leases so that only one job runner is active per deployment.
+
+FileLease covers several runners on one host (or sharing one volume);
+ClickHouseLease covers runners in separate containers that only share the
+database. Both expose the same acquire / renew / release interface.
+"""
+import fcntl
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+
+def default_holder():
+    """
+    An identity for this process that is unique across hosts and restarts.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class NoLease:
+    """
+    Always the leader; for setups that guarantee a single runner themselves.
+    """
+
+    def acquire(self):
+        return True
+
+    def renew(self):
+        return True
+
+    def release(self):
+        pass
+
+
+class FileLease:
+    """
+    An exclusive, non-blocking flock on a local file.
+
+    The kernel drops the lock when the process exits, so a crashed runner
+    never leaves a stale lease behind.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        if self._file is not None:
+            return True
+        handle = open(self.path, 'a+')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        handle.seek(0)
+        handle.truncate()
+        handle.write(f"{os.getpid()}\n")
+        handle.flush()
+        self._file = handle
+        return True
+
+    def renew(self):
+        return self._file is not None
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+class ClickHouseLease:
+    """
+    A time-limited lease stored in the job_leases table.
+
+    ClickHouse has no compare-and-set, so a claim is an insert followed by a
+    read after `settle` seconds: the latest claim wins, and every contender
+    reads the same winner once all claims are visible. The holder must call
+    renew() well within `ttl`; a runner that stops renewing loses the lease
+    when it expires.
+    """
+
+    def __init__(self, client, name, holder=None, ttl=60, settle=2.0):
+        self.client = client
+        self.name = name
+        self.holder = holder or default_holder()
+        self.ttl = ttl
+        self.settle = settle
+
+    def _current(self):
+        result = self.client.query(
+            """
+            SELECT argMax(holder, claimed_at), argMax(expires_at, claimed_at)
+            FROM job_leases
+            WHERE name = %(name)s
+            """,
+            parameters={'name': self.name},
+        )
+        holder, expires_at = result.result_set[0] if result.result_set else (None, None)
+        return holder or None, expires_at
+
+    def _claim(self):
+        now = datetime.now(timezone.utc)
+        self.client.insert(
+            'job_leases',
+            [[self.name, self.holder, now, now + timedelta(seconds=self.ttl)]],
+            column_names=['name', 'holder', 'claimed_at', 'expires_at'],
+        )
+
+    def acquire(self):
+        holder, expires_at = self._current()
+        if holder and holder != self.holder and expires_at and expires_at > datetime.now(timezone.utc):
+            return False
+        self._claim()
+        time.sleep(self.settle)
+        holder, _ = self._current()
+        return holder == self.holder
+
+    def renew(self):
+        holder, expires_at = self._current()
+        if holder != self.holder or expires_at is None or expires_at <= datetime.now(timezone.utc):
+            return False
+        self._claim()
+        return True
+
+    def release(self):
+        holder, _ = self._current()
+        if holder == self.holder:
+            now = datetime.now(timezone.utc)
+            self.client.insert(
+                'job_leases',
+                [[self.name, self.holder, now, now]],
+                column_names=['name', 'holder', 'claimed_at', 'expires_at'],
+            )
@@ -0,0 +1,154 @@
+"""
+Prometheus metrics for the background jobs.
+
+Job runs, ClickHouse calls and Deriv calls are recorded as counters and
+histograms and served in the Prometheus text format by the job runner
+(`python manage.py run_jobs`, port METRICS_PORT, 0 to disable).
+
+ClickHouse calls are measured by InstrumentedClient, which wraps the shared
+client, so every caller is covered without changes. Rows read are taken from
+the server's query summary (rows scanned) when it reports one, and counted
+as they are returned otherwise.
+"""
+import os
+import time
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))
+
+JOB_DURATION = Histogram(
+    'forex_job_duration_seconds', 'Duration of one background job run.', ['job'],
+    buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 900, 3600),
+)
+JOB_RUNS = Counter('forex_job_runs_total', 'Background job runs by outcome.', ['job', 'outcome'])
+JOB_SKIPPED = Counter('forex_job_skipped_total', 'Scheduled runs skipped because the previous run overran.', ['job'])
+
+CLICKHOUSE_DURATION = Histogram(
+    'forex_clickhouse_call_seconds', 'Latency of ClickHouse calls.', ['operation'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 120),
+)
+CLICKHOUSE_ERRORS = Counter('forex_clickhouse_errors_total', 'Failed ClickHouse calls.', ['operation'])
+CLICKHOUSE_ROWS_READ = Counter('forex_clickhouse_rows_read_total', 'Rows read by ClickHouse queries.', ['operation'])
+CLICKHOUSE_WRITES = Counter(
+    'forex_clickhouse_writes_total', 'Statements and inserts that change data (INSERT, ALTER, ...).', ['operation'],
+)
+CLICKHOUSE_ROWS_WRITTEN = Counter('forex_clickhouse_rows_written_total', 'Rows written by client-side inserts.')
+
+DERIV_DURATION = Histogram(
+    'forex_deriv_call_seconds', 'Latency of Deriv API calls.', ['call'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DERIV_ERRORS = Counter('forex_deriv_errors_total', 'Failed Deriv API calls by error code.', ['call', 'code'])
+DERIV_RETRIES = Counter('forex_deriv_retries_total', 'Deriv API calls retried after a transient failure.', ['call'])
+DERIV_RATE = Gauge('forex_deriv_rate_limit', 'Deriv requests per second currently allowed by the adaptive limiter.')
+DERIV_CIRCUIT_OPEN = Gauge('forex_deriv_circuit_open', '1 while the Deriv circuit breaker is open or half-open.')
+
+LIMIT_BREACHES = Counter('forex_limit_breaches_total', 'Users disabled for reaching a P&L limit.', ['limit', 'source'])
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """
+    Serve /metrics on `port` from a daemon thread; returns False when disabled.
+    """
+    if not port:
+        return False
+    start_http_server(port)
+    return True
+
+
+def _read_rows(result):
+    summary = getattr(result, 'summary', None) or {}
+    try:
+        return int(summary.get('read_rows', 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+class _TimedStream:
+    """
+    A block stream context that counts rows and times the whole read.
+    """
+
+    def __init__(self, operation, context, started):
+        self.operation = operation
+        self.context = context
+        self.started = started
+
+    def __enter__(self):
+        stream = self.context.__enter__()
+        return self._blocks(stream)
+
+    def _blocks(self, stream):
+        for block in stream:
+            CLICKHOUSE_ROWS_READ.labels(self.operation).inc(len(block))
+            yield block
+
+    def __exit__(self, *exc_info):
+        try:
+            return self.context.__exit__(*exc_info)
+        finally:
+            CLICKHOUSE_DURATION.labels(self.operation).observe(time.perf_counter() - self.started)
+            if exc_info[0] is not None:
+                CLICKHOUSE_ERRORS.labels(self.operation).inc()
+
+
+class InstrumentedClient:
+    """
+    Wraps a clickhouse_connect client and records metrics for every call.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _timed(self, operation, func, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            CLICKHOUSE_ERRORS.labels(operation).inc()
+            raise
+        finally:
+            CLICKHOUSE_DURATION.labels(operation).observe(time.perf_counter() - started)
+
+    def query(self, *args, **kwargs):
+        result = self._timed('query', self._client.query, *args, **kwargs)
+        CLICKHOUSE_ROWS_READ.labels('query').inc(_read_rows(result) or len(result.result_set))
+        return result
+
+    def query_df(self, *args, **kwargs):
+        frame = self._timed('query_df', self._client.query_df, *args, **kwargs)
+        CLICKHOUSE_ROWS_READ.labels('query_df').inc(len(frame))
+        return frame
+
+    def command(self, cmd, *args, **kwargs):
+        result = self._timed('command', self._client.command, cmd, *args, **kwargs)
+        if not cmd.lstrip().upper().startswith(('SELECT', 'SHOW', 'EXISTS', 'DESCRIBE')):
+            CLICKHOUSE_WRITES.labels('command').inc()
+        return result
+
+    def insert(self, table, data, *args, **kwargs):
+        result = self._timed('insert', self._client.insert, table, data, *args, **kwargs)
+        CLICKHOUSE_WRITES.labels('insert').inc()
+        CLICKHOUSE_ROWS_WRITTEN.inc(len(data))
+        return result
+
+    def _stream(self, operation, func, *args, **kwargs):
+        # Timed from the request until the last block is read, in _TimedStream
+        started = time.perf_counter()
+        try:
+            context = func(*args, **kwargs)
+        except Exception:
+            CLICKHOUSE_ERRORS.labels(operation).inc()
+            CLICKHOUSE_DURATION.labels(operation).observe(time.perf_counter() - started)
+            raise
+        return _TimedStream(operation, context, started)
+
+    def query_row_block_stream(self, *args, **kwargs):
+        return self._stream('row_block_stream', self._client.query_row_block_stream, *args, **kwargs)
+
+    def query_df_stream(self, *args, **kwargs):
+        return self._stream('df_stream', self._client.query_df_stream, *args, **kwargs)
@@ -0,0 +1,199 @@
+"""
+Incremental risk engine: acts on P&L limit breaches within seconds of a trade.
+
+auto_trading_monitor re-sums P&L for every user every 5 minutes. The engine
+instead keeps running daily and overall P&L totals per trading user in
+memory. It seeds them once from daily_pnl (the same numbers
+auto_trading_monitor reads), then tails trade_events, which the
+trade_events_mv view fills with every new trade and the time it reached
+ClickHouse. Each new trade is an O(1) update of two totals followed by a
+check of that user's limits. Breaches found in one poll are written as one
+user_trading_state insert.
+
+The tail reads rows ingested after the last watermark and at least
+`settle` seconds ago, so inserts that are still becoming visible are picked
+up by the next poll instead of being skipped. The engine reseeds at the
+start of each day and every `reseed_interval` seconds to pick up new users
+and changed limits; auto_trading_monitor keeps running as the periodic
+full reconciliation.
+"""
+import logging
+import os
+import time
+from datetime import date, datetime, timezone
+
+from .async_client import get_async_clickhouse_client
+from .config_snapshot import get_config_snapshot
+from .metrics import LIMIT_BREACHES
+from .sharding import shard_condition
+from .streaming import iter_row_blocks
+from .user_eligibility_checker import iter_user_limits
+from .user_state import record_user_state
+
+logger = logging.getLogger(__name__)
+
+RISK_ENGINE_POLL_INTERVAL = float(os.getenv('RISK_ENGINE_POLL_INTERVAL', '2'))
+RISK_ENGINE_SETTLE_SECONDS = float(os.getenv('RISK_ENGINE_SETTLE_SECONDS', '1'))
+RISK_ENGINE_RESEED_INTERVAL = int(os.getenv('RISK_ENGINE_RESEED_INTERVAL', '3600'))
+
+
+class UserRisk:
+    """
+    Limits and running P&L totals of one trading user.
+    """
+    __slots__ = (
+        'daily_loss_limit', 'daily_win_limit', 'overall_loss_limit', 'overall_win_limit',
+        'start_date', 'daily_pl', 'overall_pl', 'halted_today',
+    )
+
+    def __init__(self, balance, loss_per_day, win_per_day, overall_loss, overall_win,
+                 start_date, daily_pl=0.0, overall_pl=0.0, halted_today=False):
+        # Same limits as evaluate_limits: percentages of the balance
+        self.daily_loss_limit = -abs(loss_per_day * balance / 100)
+        self.daily_win_limit = abs(win_per_day * balance / 100)
+        self.overall_loss_limit = -abs(overall_loss * balance / 100)
+        self.overall_win_limit = abs(overall_win * balance / 100)
+        self.start_date = start_date
+        self.daily_pl = daily_pl
+        self.overall_pl = overall_pl
+        self.halted_today = halted_today
+
+    def daily_breach(self):
+        return self.daily_pl <= self.daily_loss_limit or self.daily_pl >= self.daily_win_limit
+
+    def overall_breach(self):
+        return self.overall_pl <= self.overall_loss_limit or self.overall_pl >= self.overall_win_limit
+
+
+def _number(value):
+    # DataFrame blocks carry NaN for missing limits, as in evaluate_limits
+    return 0.0 if value is None or value != value else float(value)
+
+
+def _day(value):
+    # Dates come back as datetime.date in row blocks but as Timestamps in DataFrames
+    if value is None or value != value:
+        return None
+    return value.date() if isinstance(value, datetime) else value
+
+
+class RiskEngine:
+    """
+    Running P&L totals for every trading user, updated from new trades.
+    """
+
+    def __init__(self, settle=RISK_ENGINE_SETTLE_SECONDS, reseed_interval=RISK_ENGINE_RESEED_INTERVAL):
+        self.settle = settle
+        self.reseed_interval = reseed_interval
+        self.users = {}
+        self.today = None
+        self.watermark = None
+        self.seeded_at = None
+
+    def seed(self, client, today=None):
+        """
+        Load limits and P&L totals for every trading user and start tailing from now.
+        """
+        today = today or date.today()
+        snapshot = get_config_snapshot()
+        snapshot.refresh(client)
+        users = {}
+        for frame in iter_user_limits(client, today, snapshot):
+            for row in frame.itertuples(index=False):
+                users[row.email] = UserRisk(
+                    _number(row.balance), _number(row.loss_per_day), _number(row.win_per_day),
+                    _number(row.overall_loss), _number(row.overall_win), _day(row.start_date),
+                    _number(row.daily_profit_loss), _number(row.overall_profit_loss),
+                    # Users already stopped for today are not breached and recorded again
+                    halted_today=not row.trading_today,
+                )
+        # Trades already in daily_pnl must not be applied again. One inserted
+        # after the seed query but before this read is missed here and left to
+        # auto_trading_monitor, rather than being counted twice.
+        watermark = client.query("SELECT max(ingested_at) FROM trade_events").result_set[0][0]
+        self.users = users
+        self.today = today
+        self.watermark = watermark or datetime.fromtimestamp(0, timezone.utc)
+        self.seeded_at = time.monotonic()
+        logger.info("Risk engine seeded with %d trading user(s)", len(users),
+                    extra={'job': 'risk_engine', 'users': len(users)})
+
+    def apply(self, email, day, profit_loss):
+        """
+        Add one trade to the user's totals; returns 'overall', 'daily' or None for the breach it causes.
+        """
+        user = self.users.get(email)
+        if user is None:
+            return None
+        if day == self.today:
+            user.daily_pl += profit_loss
+        if user.start_date is None or day >= user.start_date:
+            user.overall_pl += profit_loss
+
+        if user.overall_breach():
+            # Trading is off for good; stop tracking until the next reseed
+            del self.users[email]
+            return 'overall'
+        if not user.halted_today and user.daily_breach():
+            user.halted_today = True
+            return 'daily'
+        return None
+
+    def poll(self, client):
+        """
+        Apply every trade ingested since the last poll and disable users that breached a limit.
+        """
+        daily_breaches, overall_breaches = [], []
+        watermark = self.watermark
+        for block in iter_row_blocks(
+            client,
+            f"""
+            SELECT email, day, profit_loss, ingested_at
+            FROM trade_events
+            WHERE ingested_at > toDateTime64(%(watermark)s, 6, 'UTC')
+              AND ingested_at <= now64(6, 'UTC') - toIntervalMillisecond(%(settle_ms)s)
+              AND {shard_condition()}
+            ORDER BY ingested_at
+            """,
+            # Bound datetimes lose their microseconds, which would re-read the last rows
+            parameters={
+                'watermark': self.watermark.strftime('%Y-%m-%d %H:%M:%S.%f'),
+                'settle_ms': int(self.settle * 1000),
+            },
+        ):
+            for email, day, profit_loss, ingested_at in block:
+                breach = self.apply(email, _day(day), profit_loss)
+                if breach == 'overall':
+                    overall_breaches.append(email)
+                elif breach == 'daily':
+                    daily_breaches.append(email)
+                watermark = ingested_at
+        self.watermark = watermark
+
+        if daily_breaches:
+            record_user_state(client, daily_breaches, trading_today=False)
+            LIMIT_BREACHES.labels('daily', 'risk_engine').inc(len(daily_breaches))
+            for email in daily_breaches:
+                logger.info("%s has reached daily limits. Trading today disabled.", email,
+                            extra={'email': email, 'limit': 'daily'})
+        if overall_breaches:
+            record_user_state(client, overall_breaches, trading=False, trading_today=False)
+            LIMIT_BREACHES.labels('overall', 'risk_engine').inc(len(overall_breaches))
+            for email in overall_breaches:
+                logger.info("%s has reached overall limits. Trading permanently disabled.", email,
+                            extra={'email': email, 'limit': 'overall'})
+        return daily_breaches, overall_breaches
+
+    async def run_once(self):
+        """
+        One scheduler tick: reseed when due, then apply new trades.
+        """
+        db = get_async_clickhouse_client()
+        client = await db.client()
+        if (
+            self.seeded_at is None
+            or self.today != date.today()
+            or time.monotonic() - self.seeded_at >= self.reseed_interval
+        ):
+            await db.run(self.seed, client)
+        await db.run(self.poll, client)
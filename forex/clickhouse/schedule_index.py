@@ -0,0 +1,317 @@
+"""
+Start/stop transitions applied at the moment they are due.
+
+enable_disable_accounts ran every 24 hours from whenever the runner
+started, rescanned every schedule and only enabled accounts whose
+start_date was exactly today, so starts were late by up to a day and a
+start missed by one run was never applied. ScheduleRunner instead keeps a
+min-heap of upcoming transitions:
+
+- start: start_date at 00:00 in SCHEDULE_TIMEZONE, enables trading;
+- stop: stop_date at 00:00, disables trading;
+- day: every midnight, re-enables trading_today for users still trading
+  (the daily reset that enable_disable_accounts used to do), except users
+  stopped for the day since that midnight.
+
+The heap is built once from the config snapshot and then updated only for
+the users whose start or stop date changed (ConfigSnapshot.changes_since).
+The runner sleeps until the earliest transition, then applies every due
+transition as one batch of user_trading_state inserts.
+
+How far transitions have been applied is kept in job_watermarks, so starts
+that fell due while no runner was active are applied on the next start
+instead of being skipped. Stops are always safe to apply again, so overdue
+stops are applied whenever a schedule is indexed.
+"""
+import asyncio
+import heapq
+import logging
+import os
+from datetime import datetime, time, timedelta, timezone
+
+import pytz
+
+from .async_client import get_async_clickhouse_client
+from .config_snapshot import get_config_snapshot
+from .sharding import current_shard
+from .user_state import record_user_state, reset_trading_today
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_TIMEZONE = os.getenv('SCHEDULE_TIMEZONE', 'UTC')
+# How often start_stop_table is checked for changes, and the longest the
+# runner sleeps without re-checking the clock (seconds)
+SCHEDULE_SYNC_INTERVAL = int(os.getenv('SCHEDULE_SYNC_INTERVAL', '60'))
+SCHEDULE_MAX_SLEEP = int(os.getenv('SCHEDULE_MAX_SLEEP', '3600'))
+
+START, STOP, DAY = 'start', 'stop', 'day'
+# Order of a batch: the daily reset first, so a stop at the same midnight wins
+_APPLY_ORDER = {DAY: 0, START: 1, STOP: 2}
+_EPOCH = datetime.fromtimestamp(0, timezone.utc)
+
+
+class ScheduleIndex:
+    """
+    Min-heap of upcoming (when, kind, email) transitions with lazy removal.
+
+    Each user's entries carry the version of their schedule when pushed; a
+    user whose schedule changes gets a new version, and entries of older
+    versions are dropped when they reach the top of the heap.
+    """
+
+    def __init__(self, tz=SCHEDULE_TIMEZONE):
+        self.tz = pytz.timezone(tz)
+        self.dates = {}      # email -> (start_date, stop_date) as indexed
+        self._versions = {}  # email -> schedule version
+        self._heap = []      # (when, order, email, version, kind)
+
+    def midnight(self, day):
+        """
+        00:00 of `day` in the schedule timezone, as an aware UTC datetime.
+        """
+        return self.tz.localize(datetime.combine(day, time.min)).astimezone(timezone.utc)
+
+    def next_midnight(self, now):
+        local_day = now.astimezone(self.tz).date()
+        return self.midnight(local_day + timedelta(days=1))
+
+    def _push(self, when, kind, email=None, version=0):
+        heapq.heappush(self._heap, (when, _APPLY_ORDER[kind], email or '', version, kind))
+
+    def set_schedule(self, email, start_date, stop_date, now, applied_until):
+        """
+        Index the schedule of one user; returns the transitions already due.
+
+        A stop at or before `now` is due at once. A start that has passed is
+        due at once if the user is not stopped yet and the start is new: a
+        changed start_date, or (with `applied_until`, when the index is first
+        built) one later than the last transition applied. Later transitions
+        go on the heap.
+        """
+        previous = self.dates.get(email)
+        if previous == (start_date, stop_date):
+            return []
+        version = self._versions.get(email, 0) + 1
+        self._versions[email] = version
+        if start_date is None and stop_date is None:
+            self.dates.pop(email, None)
+            return []
+        self.dates[email] = (start_date, stop_date)
+
+        due = []
+        stop_at = self.midnight(stop_date) if stop_date is not None else None
+        if stop_at is not None:
+            if stop_at <= now:
+                due.append((STOP, email))
+            else:
+                self._push(stop_at, STOP, email, version)
+        if start_date is not None and stop_at is not None and start_date < stop_date:
+            start_at = self.midnight(start_date)
+            if start_at > now:
+                self._push(start_at, START, email, version)
+            elif stop_at > now and (
+                start_at > applied_until if applied_until is not None
+                else previous is None or previous[0] != start_date
+            ):
+                due.append((START, email))
+        return due
+
+    def remove(self, email):
+        self.set_schedule(email, None, None, None, None)
+
+    def schedule_day(self, now):
+        self._push(self.next_midnight(now), DAY)
+
+    def _is_current(self, entry):
+        _, _, email, version, kind = entry
+        return kind == DAY or self._versions.get(email) == version
+
+    def _discard_stale(self):
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+        # At most a start and a stop per user are live; rebuild once stale entries dominate
+        if len(self._heap) > 4 * len(self.dates) + 1024:
+            self._heap = [entry for entry in self._heap if self._is_current(entry)]
+            heapq.heapify(self._heap)
+
+    def next_due(self):
+        """
+        Time of the earliest pending transition, or None.
+        """
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """
+        Remove and return every transition due at or before `now` as (kind, email) pairs.
+        """
+        due = []
+        while True:
+            self._discard_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+            _, _, email, _, kind = heapq.heappop(self._heap)
+            due.append((kind, email or None))
+
+
+class ScheduleRunner:
+    """
+    Keeps a ScheduleIndex in sync with start_stop_table and applies transitions on time.
+
+    sync() runs as a periodic job and run() as a long-lived service of the
+    same Scheduler; sync() wakes run() when a change moves the next
+    transition earlier.
+    """
+
+    def __init__(self, tz=SCHEDULE_TIMEZONE, max_sleep=SCHEDULE_MAX_SLEEP):
+        self.tz = tz
+        self.max_sleep = max_sleep
+        self.name = f"schedule{current_shard().suffix}"
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the index; the next sync rebuilds it from the stored watermark.
+        """
+        self.index = ScheduleIndex(self.tz)
+        self.applied_until = None
+        self._version = None
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc)
+
+    def _load_watermark(self, client):
+        result = client.query(
+            "SELECT argMax(watermark, updated_at) FROM job_watermarks WHERE name = %(name)s",
+            parameters={'name': self.name},
+        )
+        watermark = result.result_set[0][0] if result.result_set else None
+        if watermark is None or watermark <= _EPOCH:
+            return None
+        return watermark if watermark.tzinfo else watermark.replace(tzinfo=timezone.utc)
+
+    def _save_watermark(self, client, watermark):
+        client.insert(
+            'job_watermarks',
+            [[self.name, watermark, self._now()]],
+            column_names=['name', 'watermark', 'updated_at'],
+        )
+
+    def _index(self, snapshot, now):
+        """
+        Bring the index up to date with the snapshot; returns the transitions due now.
+        """
+        building = self._version is None
+        changed = None if building else snapshot.changes_since(self._version, 'start_stop_table')
+        if changed is None:
+            # Every schedule, plus users dropped from start_stop_table since the last build
+            emails = list(set(snapshot.emails_where(lambda c: c.has_schedule)) | set(self.index.dates))
+        else:
+            emails = list(changed)
+        self._version = snapshot.version
+
+        applied_until = self.applied_until if building else None
+        due = []
+        for email, record in zip(emails, snapshot.lookup(emails)):
+            if record is None or not record.has_schedule:
+                self.index.remove(email)
+            else:
+                due += self.index.set_schedule(email, record.start_date, record.stop_date, now, applied_until)
+        return due
+
+    def _apply(self, client, due, until):
+        """
+        Write one batch of transitions and advance the watermark to `until`.
+        """
+        by_kind = {}
+        for kind, email in due:
+            by_kind.setdefault(kind, []).append(email)
+        # One client-side stamp for the batch, a microsecond apart per kind in
+        # _APPLY_ORDER, so a stop at the same midnight still wins over the reset
+        stamped = self._now()
+        if DAY in by_kind:
+            # A reset caught up after a restart runs later in the day; users
+            # stopped for today since midnight (a daily limit) stay stopped
+            today = self.index.midnight(until.astimezone(self.index.tz).date())
+            reset_trading_today(client, today, stamped)
+        if START in by_kind:
+            record_user_state(client, by_kind[START], stamped + timedelta(microseconds=_APPLY_ORDER[START]),
+                              trading=True, trading_today=True)
+        if STOP in by_kind:
+            record_user_state(client, by_kind[STOP], stamped + timedelta(microseconds=_APPLY_ORDER[STOP]),
+                              trading=False, trading_today=False)
+        self._save_watermark(client, until)
+        self.applied_until = until
+        if due:
+            logger.info(
+                "Applied %d start(s) and %d stop(s)%s", len(by_kind.get(START, ())), len(by_kind.get(STOP, ())),
+                " and the daily reset" if DAY in by_kind else "",
+                extra={'job': 'schedule', 'starts': len(by_kind.get(START, ())), 'stops': len(by_kind.get(STOP, ()))},
+            )
+
+    def _sync(self, client):
+        snapshot = get_config_snapshot()
+        snapshot.refresh(client)
+        now = self._now()
+        due = []
+        if self.applied_until is None:
+            today = self.index.midnight(now.astimezone(self.index.tz).date())
+            # Without a watermark (first run ever), today's starts are still to apply
+            self.applied_until = self._load_watermark(client) or today - timedelta(microseconds=1)
+            if self.applied_until < today:
+                due.append((DAY, None))
+            self.index.schedule_day(now)
+        before = self.index.next_due()
+        due += self._index(snapshot, now)
+        if due:
+            self._apply(client, due, max(now, self.applied_until))
+        after = self.index.next_due()
+        return after is not None and (before is None or after < before)
+
+    async def sync(self):
+        """
+        Pick up schedule changes; applies any that are already due.
+        """
+        db = get_async_clickhouse_client()
+        async with self._lock:
+            try:
+                woken = await db.run(self._sync, await db.client())
+            except Exception:
+                self.reset()
+                raise
+        if woken:
+            self._wake.set()
+
+    async def run(self):
+        """
+        Sleep until the next transition, apply everything due, repeat.
+        """
+        db = get_async_clickhouse_client()
+        if self.applied_until is None:
+            await self.sync()
+        while True:
+            self._wake.clear()
+            # next_due() drops stale entries, so it must not run alongside _sync in its executor thread
+            async with self._lock:
+                next_due = self.index.next_due()
+            delay = self.max_sleep if next_due is None else (next_due - self._now()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=min(delay, self.max_sleep))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            async with self._lock:
+                now = self._now()
+                due = self.index.pop_due(now)
+                if any(kind == DAY for kind, _ in due):
+                    self.index.schedule_day(now)
+                try:
+                    await db.run(self._apply, await db.client(), due, now)
+                except Exception:
+                    # The popped transitions are lost; rebuild from the watermark, which was not advanced
+                    self.reset()
+                    raise
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import math
+import random
+import time
+from datetime import datetime, timedelta
+
+from .metrics import JOB_DURATION, JOB_RUNS, JOB_SKIPPED
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicJob:
+    """
+    A coroutine function run every `interval` seconds.
+
+    `jitter` adds up to that many random seconds to each start so jobs that
+    share an interval do not hit ClickHouse at the same instant, and `timeout`
+    (default: the interval) bounds a single run. `quiet` jobs, which run every
+    few seconds, do not announce their next run.
+    """
+
+    def __init__(self, name, func, interval, jitter=0.0, timeout=None, quiet=False):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout if timeout is not None else interval
+        self.quiet = quiet
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+
+
+class Service:
+    """
+    A long-running coroutine function, started again `restart_delay` seconds after it fails.
+    """
+
+    def __init__(self, name, func, restart_delay=30):
+        self.name = name
+        self.func = func
+        self.restart_delay = restart_delay
+        self.failures = 0
+
+
+class Scheduler:
+    """
+    Runs registered jobs at a fixed rate on the current event loop.
+
+    Run times are computed from the scheduler start (start + n * interval),
+    so they do not drift with the duration of each run. A job never overlaps
+    itself: if a run overruns one or more ticks, those ticks are skipped and
+    the job waits for the next one. Each job runs in its own task, and a
+    failing or timed-out run is reported without affecting other jobs. The
+    duration and outcome of every run are recorded in the job metrics.
+
+    Services, which time their own work (such as the schedule runner), run
+    alongside the jobs and are restarted when they fail.
+    """
+
+    def __init__(self):
+        self.jobs = []
+        self.services = []
+
+    def register(self, name, func, interval, jitter=0.0, timeout=None, quiet=False):
+        job = PeriodicJob(name, func, interval, jitter=jitter, timeout=timeout, quiet=quiet)
+        self.jobs.append(job)
+        return job
+
+    def register_service(self, name, func, restart_delay=30):
+        service = Service(name, func, restart_delay=restart_delay)
+        self.services.append(service)
+        return service
+
+    async def run(self):
+        await asyncio.gather(
+            *(self._run_job(job) for job in self.jobs),
+            *(self._run_service(service) for service in self.services),
+        )
+
+    async def _run_service(self, service):
+        while True:
+            try:
+                await service.func()
+                logger.warning("%s stopped, restarting in %s seconds", service.name, service.restart_delay,
+                               extra={'job': service.name})
+            except Exception:
+                service.failures += 1
+                JOB_RUNS.labels(service.name, 'error').inc()
+                logger.exception("%s failed, restarting in %s seconds", service.name, service.restart_delay,
+                                 extra={'job': service.name})
+            await asyncio.sleep(service.restart_delay)
+
+    async def _run_job(self, job):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        tick = 0
+        while True:
+            delay = started + tick * job.interval + random.uniform(0, job.jitter) - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            await self._run_once(job)
+
+            # Next tick that has not started yet; anything in between was missed
+            next_tick = math.floor((loop.time() - started) / job.interval) + 1
+            if next_tick > tick + 1:
+                skipped = next_tick - tick - 1
+                job.skipped += skipped
+                JOB_SKIPPED.labels(job.name).inc(skipped)
+                logger.warning("%s overran its interval, skipping %d run(s)", job.name, skipped,
+                               extra={'job': job.name})
+            tick = max(tick + 1, next_tick)
+            if job.quiet:
+                continue
+            next_run = datetime.now() + timedelta(seconds=started + tick * job.interval - loop.time())
+            logger.info("%s next run at %s", job.name, f"{next_run:%Y-%m-%d %H:%M:%S}", extra={'job': job.name})
+
+    async def _run_once(self, job):
+        job.runs += 1
+        outcome = 'success'
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(job.func(), timeout=job.timeout)
+        except asyncio.TimeoutError:
+            job.failures += 1
+            outcome = 'timeout'
+            logger.error("%s timed out after %s seconds", job.name, job.timeout, extra={'job': job.name})
+        except Exception:
+            job.failures += 1
+            outcome = 'error'
+            logger.exception("%s failed", job.name, extra={'job': job.name})
+        except asyncio.CancelledError:
+            outcome = 'cancelled'
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            JOB_DURATION.labels(job.name).observe(seconds)
+            JOB_RUNS.labels(job.name, outcome).inc()
+        if not job.quiet:
+            logger.info("%s finished in %.3f seconds (%s)", job.name, seconds, outcome,
+                        extra={'job': job.name, 'seconds': seconds, 'outcome': outcome})
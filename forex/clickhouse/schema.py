@@ -0,0 +1,200 @@
+"""
+One-time ClickHouse schema bootstrap.
+
+DDL that used to be sent on every job iteration lives here and runs once when
+the background jobs start.
+"""
+import os
+
+# Retention of balance history, in days. Raw samples are kept the shortest,
+# the daily rollup forever (0 disables the TTL).
+BALANCE_RETENTION_DAYS = int(os.getenv('BALANCE_RETENTION_DAYS', '180'))
+BALANCE_HOURLY_RETENTION_DAYS = int(os.getenv('BALANCE_HOURLY_RETENTION_DAYS', '730'))
+BALANCE_DAILY_RETENTION_DAYS = int(os.getenv('BALANCE_DAILY_RETENTION_DAYS', '0'))
+
+
+def ttl_clause(column, days):
+    """
+    TTL clause dropping rows `days` after `column`, or nothing when days is 0.
+    """
+    return f"TTL {column} + INTERVAL {days} DAY" if days else ""
+
+
+# Balance history is read per email, so it is ordered by (email, timestamp)
+# and partitioned by month so retention drops whole partitions.
+BALANCES_TABLE_TEMPLATE = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        timestamp DateTime,
+        balance Float32,
+        email String
+    ) ENGINE = MergeTree()
+    PARTITION BY toYYYYMM(timestamp)
+    ORDER BY (email, timestamp)
+    {ttl}
+"""
+
+BALANCES_TABLE = BALANCES_TABLE_TEMPLATE.format(
+    table='balances', ttl=ttl_clause('timestamp', BALANCE_RETENTION_DAYS),
+)
+
+# Hourly and daily rollups of balances: first/last/min/max balance per bucket.
+BALANCES_ROLLUP_TEMPLATE = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        email String,
+        bucket DateTime,
+        open_balance AggregateFunction(argMin, Float32, DateTime),
+        close_balance AggregateFunction(argMax, Float32, DateTime),
+        min_balance SimpleAggregateFunction(min, Float32),
+        max_balance SimpleAggregateFunction(max, Float32),
+        samples SimpleAggregateFunction(sum, UInt64)
+    ) ENGINE = AggregatingMergeTree()
+    PARTITION BY toYYYYMM(bucket)
+    ORDER BY (email, bucket)
+    {ttl}
+"""
+
+BALANCES_ROLLUP_SELECT = """
+    SELECT email, {bucket}(timestamp) AS bucket,
+           argMinState(balance, timestamp) AS open_balance,
+           argMaxState(balance, timestamp) AS close_balance,
+           min(balance) AS min_balance,
+           max(balance) AS max_balance,
+           count() AS samples
+    FROM {source}
+"""
+
+BALANCES_HOURLY_TABLE = BALANCES_ROLLUP_TEMPLATE.format(
+    table='balances_hourly', ttl=ttl_clause('bucket', BALANCE_HOURLY_RETENTION_DAYS),
+)
+BALANCES_DAILY_TABLE = BALANCES_ROLLUP_TEMPLATE.format(
+    table='balances_daily', ttl=ttl_clause('bucket', BALANCE_DAILY_RETENTION_DAYS),
+)
+BALANCES_HOURLY_VIEW = (
+    "CREATE MATERIALIZED VIEW IF NOT EXISTS balances_hourly_mv TO balances_hourly AS"
+    + BALANCES_ROLLUP_SELECT.format(bucket='toStartOfHour', source='balances') + "GROUP BY email, bucket"
+)
+BALANCES_DAILY_VIEW = (
+    "CREATE MATERIALIZED VIEW IF NOT EXISTS balances_daily_mv TO balances_daily AS"
+    + BALANCES_ROLLUP_SELECT.format(bucket='toStartOfDay', source='balances') + "GROUP BY email, bucket"
+)
+BALANCES_ROLLUPS = {
+    'balances_hourly': ('balances_hourly_mv', 'toStartOfHour'),
+    'balances_daily': ('balances_daily_mv', 'toStartOfDay'),
+}
+
+# Per-email, per-day P&L kept up to date from `trades` so risk checks read
+# days x users rows instead of every trade.
+DAILY_PNL_TABLE = """
+    CREATE TABLE IF NOT EXISTS daily_pnl (
+        email String,
+        day Date,
+        profit_loss Float64
+    ) ENGINE = SummingMergeTree()
+    ORDER BY (email, day)
+"""
+
+DAILY_PNL_VIEW = """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS daily_pnl_mv TO daily_pnl AS
+    SELECT email, toDate(timestamp) AS day, toFloat64(sum(profit_loss)) AS profit_loss
+    FROM trades
+    GROUP BY email, day
+"""
+
+# Every trade again, stamped with the time it reached ClickHouse, so the risk
+# engine can tail new trades by an ingest watermark (see risk_engine.py).
+TRADE_EVENTS_RETENTION_DAYS = int(os.getenv('TRADE_EVENTS_RETENTION_DAYS', '7'))
+
+TRADE_EVENTS_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS trade_events (
+        email String,
+        day Date,
+        profit_loss Float64,
+        ingested_at DateTime64(6, 'UTC')
+    ) ENGINE = MergeTree()
+    ORDER BY ingested_at
+    {ttl_clause('toDateTime(ingested_at)', TRADE_EVENTS_RETENTION_DAYS)}
+"""
+
+TRADE_EVENTS_VIEW = """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS trade_events_mv TO trade_events AS
+    SELECT email, toDate(timestamp) AS day, toFloat64(profit_loss) AS profit_loss,
+           now64(6, 'UTC') AS ingested_at
+    FROM trades
+"""
+
+# Leader leases for the job runner, see forex/clickhouse/leader.py
+JOB_LEASES_TABLE = """
+    CREATE TABLE IF NOT EXISTS job_leases (
+        name String,
+        holder String,
+        claimed_at DateTime64(3, 'UTC'),
+        expires_at DateTime64(3, 'UTC')
+    ) ENGINE = ReplacingMergeTree(claimed_at)
+    ORDER BY name
+    TTL toDateTime(expires_at) + INTERVAL 1 DAY
+"""
+
+# How far each job has applied time-based work, see forex/clickhouse/schedule_index.py
+JOB_WATERMARKS_TABLE = """
+    CREATE TABLE IF NOT EXISTS job_watermarks (
+        name String,
+        watermark DateTime64(6, 'UTC'),
+        updated_at DateTime64(6, 'UTC')
+    ) ENGINE = ReplacingMergeTree(updated_at)
+    ORDER BY name
+"""
+
+# Append-only trading flags and balance per user, see forex/clickhouse/user_state.py
+USER_TRADING_STATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS user_trading_state (
+        email String,
+        field LowCardinality(String),
+        value Float64,
+        updated_at DateTime64(6, 'UTC')
+    ) ENGINE = ReplacingMergeTree(updated_at)
+    ORDER BY (email, field)
+"""
+
+USERDETAILS_CURRENT_VIEW = """
+    CREATE VIEW IF NOT EXISTS userdetails_current AS
+    SELECT u.* EXCEPT (trading, trading_today, balance_today),
+           if(st.has_trading, st.trading != 0, u.trading) AS trading,
+           if(st.has_trading_today, st.trading_today != 0, u.trading_today) AS trading_today,
+           if(st.has_balance_today, st.balance_today, u.balance_today) AS balance_today
+    FROM userdetails AS u
+    LEFT JOIN (
+        SELECT email,
+               argMaxIf(value, updated_at, field = 'trading') AS trading,
+               countIf(field = 'trading') > 0 AS has_trading,
+               argMaxIf(value, updated_at, field = 'trading_today') AS trading_today,
+               countIf(field = 'trading_today') > 0 AS has_trading_today,
+               argMaxIf(value, updated_at, field = 'balance_today') AS balance_today,
+               countIf(field = 'balance_today') > 0 AS has_balance_today
+        FROM user_trading_state
+        GROUP BY email
+    ) AS st ON u.email = st.email
+"""
+
+SCHEMA = [
+    BALANCES_TABLE,
+    BALANCES_HOURLY_TABLE,
+    BALANCES_DAILY_TABLE,
+    BALANCES_HOURLY_VIEW,
+    BALANCES_DAILY_VIEW,
+    DAILY_PNL_TABLE,
+    DAILY_PNL_VIEW,
+    TRADE_EVENTS_TABLE,
+    TRADE_EVENTS_VIEW,
+    JOB_LEASES_TABLE,
+    JOB_WATERMARKS_TABLE,
+    USER_TRADING_STATE_TABLE,
+    USERDETAILS_CURRENT_VIEW,
+]
+
+
+def bootstrap_schema(client):
+    """
+    Create every table the background jobs write to, if missing.
+    """
+    for ddl in SCHEMA:
+        client.command(ddl)
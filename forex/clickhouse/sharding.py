@@ -0,0 +1,80 @@
+"""
+Partitioning of users across job runner processes and nodes.
+
+Users are assigned to one of SHARD_COUNT shards by a stable hash of their
+email, computed in ClickHouse (cityHash64(email) modulo SHARD_COUNT), so every
+process and every node agrees on the split without coordination. A process
+serves a single shard: every job query adds shard_condition() to its WHERE
+clause and reads, evaluates and writes only that slice of users.
+
+Shard state rows are appended to the same tables by every shard, and
+ClickHouse merges them like any other insert, so shards never need to
+exchange results.
+
+A node runs the shards SHARD_INDEX, SHARD_INDEX + 1, ... in one process
+each (`run_jobs --processes N`). With the defaults (SHARD_COUNT=1) there is
+a single shard holding every user and queries are unchanged.
+"""
+import os
+
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '1'))
+SHARD_INDEX = int(os.getenv('SHARD_INDEX', '0'))
+
+
+class Shard:
+    """
+    Slice `index` of `count` of the user population.
+    """
+
+    def __init__(self, index=0, count=1):
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"Invalid shard {index} of {count}")
+        self.index = index
+        self.count = count
+
+    def condition(self, column='email'):
+        """
+        SQL condition selecting this shard's rows by the email `column`.
+        """
+        if self.count == 1:
+            return '1'
+        # modulo() rather than %, which would clash with %(name)s query parameters
+        return f"modulo(cityHash64({column}), {self.count}) = {self.index}"
+
+    @property
+    def suffix(self):
+        """
+        Suffix that keeps per-shard names (leases, lock files) apart; empty for a single shard.
+        """
+        return '' if self.count == 1 else f"-shard-{self.index}-of-{self.count}"
+
+    def __repr__(self):
+        return f"Shard({self.index}, {self.count})"
+
+
+_current = None
+
+
+def current_shard():
+    """
+    The shard this process serves (SHARD_INDEX of SHARD_COUNT unless set otherwise).
+    """
+    global _current
+    if _current is None:
+        _current = Shard(SHARD_INDEX, SHARD_COUNT)
+    return _current
+
+
+def set_current_shard(shard):
+    """
+    Serve `shard` in this process; called once at startup, before any job runs.
+    """
+    global _current
+    _current = shard
+
+
+def shard_condition(column='email'):
+    """
+    SQL condition restricting `column` to the current process's shard.
+    """
+    return current_shard().condition(column)
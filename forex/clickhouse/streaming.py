@@ -0,0 +1,59 @@
+"""
+Block-at-a-time reads for full-table scans.
+
+The jobs used to materialize whole result sets before processing them, so the
+job runner's memory grew with the user table. These generators yield one
+block at a time instead, with the block size capped by the max_block_size
+setting, so peak memory is bounded by CLICKHOUSE_STREAM_BLOCK_SIZE rows.
+
+A stream keeps its HTTP response open, and its query running, while the
+caller works on a block. The server fails the query once the client stops
+reading for longer than its send_timeout (300 seconds by default), and the
+whole read, including the caller's time, counts towards
+max_execution_time (CLICKHOUSE_QUERY_TIMEOUT, 120 seconds by default). Only
+stream when the per-block work is quick; callers that wait on slow I/O per
+block, such as Deriv calls, read pages with keyset_page_query instead
+(AsyncClickHouseClient.iter_keyset_pages), one short query per page with
+nothing kept open in between.
+"""
+import os
+
+CLICKHOUSE_STREAM_BLOCK_SIZE = int(os.getenv('CLICKHOUSE_STREAM_BLOCK_SIZE', '2000'))
+
+
+def _stream_settings(settings, block_size):
+    merged = dict(settings or {})
+    merged.setdefault('max_block_size', block_size or CLICKHOUSE_STREAM_BLOCK_SIZE)
+    return merged
+
+
+def iter_row_blocks(client, sql, parameters=None, settings=None, block_size=None):
+    """
+    Yield the result of `sql` as lists of row tuples, one block at a time.
+    """
+    with client.query_row_block_stream(sql, parameters=parameters,
+                                       settings=_stream_settings(settings, block_size)) as stream:
+        for block in stream:
+            yield block
+
+
+def iter_df_blocks(client, sql, parameters=None, settings=None, block_size=None):
+    """
+    Yield the result of `sql` as pandas DataFrames, one block at a time.
+    """
+    with client.query_df_stream(sql, parameters=parameters,
+                                settings=_stream_settings(settings, block_size)) as stream:
+        for frame in stream:
+            yield frame
+
+
+def keyset_page_query(select, table, key, where='1', page_size=None):
+    """
+    SQL for one page of `table` ordered by `key`, after the key in %(last)s.
+
+    `key` must be the first column of `select`, so a page's last row gives the next %(last)s.
+    """
+    return (
+        f"SELECT {select} FROM {table} WHERE ({where}) AND {key} > %(last)s "
+        f"ORDER BY {key} LIMIT {page_size or CLICKHOUSE_STREAM_BLOCK_SIZE}"
+    )
@@ -1,11 +1,89 @@
 import pytz  # Import pytz for timezone handling
 import asyncio
+import logging
+import os
 import threading
 
-from authorise_deriv.views import balance
 from .user_eligibility_checker import  auto_trading_monitor
 from .balance_tracker import balance__tracker
-from .account_enabler import enable_disable_accounts
+from .balance_stream import BALANCE_STREAM_FLUSH_INTERVAL, BALANCE_STREAM_SYNC_INTERVAL, BalanceStream
+from .async_client import get_async_clickhouse_client
+from .connection import get_clickhouse_client
+from .risk_engine import RISK_ENGINE_POLL_INTERVAL, RiskEngine
+from .schedule_index import SCHEDULE_SYNC_INTERVAL, ScheduleRunner
+from .schema import bootstrap_schema
+from .scheduler import Scheduler
+
+logger = logging.getLogger(__name__)
+
+# 'poll' samples every account every 2 hours; 'stream' keeps balance
+# subscriptions open and writes updates as they arrive.
+BALANCE_TRACKER_MODE = os.getenv('BALANCE_TRACKER_MODE', 'poll')
+
+# Acts on limit breaches within seconds of each trade; auto_trading_monitor
+# stays on as the 5-minute full reconciliation.
+RISK_ENGINE_ENABLED = os.getenv('RISK_ENGINE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+
+def build_scheduler():
+    """
+    Register every background job once with its interval (in seconds).
+    """
+    scheduler = Scheduler()
+    # Start/stop dates and the daily trading_today reset are applied at the
+    # transition itself; the sync job only picks up schedule changes
+    schedule = ScheduleRunner()
+    scheduler.register('schedule_sync', schedule.sync, interval=SCHEDULE_SYNC_INTERVAL, jitter=5, quiet=True)
+    scheduler.register_service('schedule_runner', schedule.run)
+    if BALANCE_TRACKER_MODE == 'stream':
+        stream = BalanceStream()
+        scheduler.register('balance_stream_sync', stream.sync, interval=BALANCE_STREAM_SYNC_INTERVAL, jitter=5)
+        scheduler.register('balance_stream_flush', stream.flush, interval=BALANCE_STREAM_FLUSH_INTERVAL)
+    else:
+        scheduler.register('balance__tracker', balance__tracker, interval=60 * 60 * 2, jitter=60)
+    scheduler.register('auto_trading_monitor', auto_trading_monitor, interval=60 * 5, jitter=5)
+    if RISK_ENGINE_ENABLED:
+        engine = RiskEngine()
+        scheduler.register('risk_engine', engine.run_once, interval=RISK_ENGINE_POLL_INTERVAL,
+                           timeout=60, quiet=True)
+    return scheduler
+
+
+async def run_as_leader(lease, renew_interval=20, retry_interval=30):
+    """
+    Run the scheduler only while this process holds `lease`.
+
+    A runner that cannot get the lease waits as a standby and retries. If the
+    lease cannot be renewed, the jobs are cancelled and the runner goes back
+    to standby, so at most one runner is active at a time.
+    """
+    # Lease calls may query ClickHouse (and wait for a claim to settle), so
+    # they run off the event loop like every other database call
+    db = get_async_clickhouse_client()
+
+    # Create the tables the jobs (and the ClickHouse lease) need first
+    await db.run(bootstrap_schema, await db.client())
+
+    while True:
+        if not await db.run(lease.acquire):
+            logger.info("Another job runner holds the lease, retrying in %s seconds", retry_interval)
+            await asyncio.sleep(retry_interval)
+            continue
+
+        logger.info("Acquired job runner lease, starting background jobs")
+        jobs = asyncio.ensure_future(build_scheduler().run())
+        try:
+            while not jobs.done():
+                await asyncio.wait({jobs}, timeout=renew_interval)
+                if not jobs.done() and not await db.run(lease.renew):
+                    logger.error("Lost the job runner lease, stopping background jobs")
+                    break
+            if jobs.done():
+                jobs.result()
+        finally:
+            jobs.cancel()
+            await db.run(lease.release)
+
 
 # startimg candle fetching automatically
 def start_candle_fetcher():
@@ -16,15 +94,12 @@ def start_candle_fetcher():
         # Create a new event loop for the thread
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
-        
-        # Run the async tasks
-        loop.run_until_complete(
-            asyncio.gather(
-                enable_disable_accounts(),
-                balance__tracker(),
-                auto_trading_monitor(),
-            )
-        )
+
+        # Create the tables the jobs write to once, before they start
+        bootstrap_schema(get_clickhouse_client())
+
+        # Run the jobs on their schedules
+        loop.run_until_complete(build_scheduler().run())
         
     # Start the thread to run the async tasks
     thread = threading.Thread(target=thread_function)
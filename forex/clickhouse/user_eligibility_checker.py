@@ -1,80 +1,221 @@
-import asyncio
+import bisect
+import logging
 from datetime import datetime
-from .connection import get_clickhouse_client
 
-# ANSI escape codes for colors
-RED = '\033[91m'
-GREEN = '\033[92m'
-YELLOW = '\033[93m'
-BLUE = '\033[94m'
-RESET = '\033[0m'  # Reset to default color
+import numpy as np
+import pandas as pd
+
+from .async_client import get_async_clickhouse_client
+from .config_snapshot import get_config_snapshot
+from .streaming import iter_df_blocks
+from .metrics import LIMIT_BREACHES
+from .sharding import shard_condition
+from .user_state import record_user_state
+
+logger = logging.getLogger(__name__)
+
+
+_LIMIT_COLUMNS = ('loss_per_day', 'overall_loss', 'win_per_day', 'overall_win', 'start_date')
+
+
+def iter_user_limits(client, today_date, snapshot=None):
+    """
+    Stream every trading user with their limits and daily/overall P&L, as DataFrame blocks.
+
+    P&L is read from the daily_pnl aggregate rather than raw trades: days from
+    each user's start_date onwards are summed with sumIf in one grouped pass,
+    keyed by email and start_date.
+
+    With a refreshed ConfigSnapshot the limits and start dates come from
+    memory, and only trading users' balances and daily_pnl are read. Only
+    users of the current shard are read.
+    """
+    if snapshot is not None:
+        return _iter_snapshot_limits(client, today_date, snapshot)
+    return iter_df_blocks(client, f"""
+        SELECT u.email AS email, u.balance AS balance,
+               toUInt8(toString(u.trading_today) IN ('1', 'true')) AS trading_today,
+               s.loss_per_day AS loss_per_day, s.overall_loss AS overall_loss,
+               s.win_per_day AS win_per_day, s.overall_win AS overall_win,
+               toDate(s.start_date) AS start_date,
+               ifNull(p.daily_profit_loss, 0) AS daily_profit_loss,
+               ifNull(p.overall_profit_loss, 0) AS overall_profit_loss
+        FROM userdetails_current AS u
+        JOIN risk_table AS r ON u.email = r.email
+        JOIN start_stop_table AS s ON u.email = s.email
+        LEFT JOIN ({_pnl_query(today_date)}) AS p ON s.email = p.email AND s.start_date = p.start_date
+        WHERE u.trading = '1' AND {shard_condition('u.email')}
+    """)
+
+
+def _pnl_query(today_date):
+    return f"""
+            SELECT d.email AS email, ss.start_date AS start_date,
+                   sumIf(d.profit_loss, d.day = toDate('{today_date}')) AS daily_profit_loss,
+                   sum(d.profit_loss) AS overall_profit_loss
+            FROM daily_pnl AS d
+            JOIN start_stop_table AS ss ON d.email = ss.email
+            WHERE d.day >= toDate(ss.start_date) AND {shard_condition('d.email')}
+            GROUP BY d.email, ss.start_date
+    """
+
+
+def _snapshot_pnl(client, today_date, snapshot):
+    """
+    Daily and overall P&L per email from daily_pnl, counting days from each
+    user's start_date in the snapshot, as two Series indexed by email.
+
+    start_stop_table is not read. The distinct start dates split the days into
+    segments, the query sums daily_pnl per (email, segment), and a user's
+    totals are the sum of the segments from their own start_date on.
+    """
+    emails = snapshot.emails_where(lambda c: c.has_risk and c.has_schedule and c.start_date is not None)
+    starts = dict(zip(emails, (record.start_date for record in snapshot.lookup(emails))))
+    boundaries = sorted(set(starts.values()))
+    if not boundaries:
+        empty = pd.Series(dtype=np.float64)
+        return empty, empty
+    # Segment i holds the days from the i-th start date (1-based) up to the next one
+    first_segment = pd.Series({
+        email: bisect.bisect_right(boundaries, start) for email, start in starts.items()
+    })
+
+    daily, overall = [], []
+    for frame in iter_df_blocks(
+        client,
+        f"""
+        WITH arrayMap(s -> toDate(s), %(boundaries)s) AS boundaries
+        SELECT email, arrayCount(b -> b <= day, boundaries) AS segment,
+               sumIf(profit_loss, day = toDate(%(today)s)) AS daily_profit_loss,
+               sum(profit_loss) AS overall_profit_loss
+        FROM daily_pnl
+        WHERE day >= toDate(%(first)s) AND {shard_condition()}
+        GROUP BY email, segment
+        """,
+        parameters={
+            'boundaries': [day.isoformat() for day in boundaries],
+            'first': boundaries[0].isoformat(),
+            'today': today_date.isoformat(),
+        },
+    ):
+        counted = frame['segment'].to_numpy() >= frame['email'].map(first_segment).to_numpy(dtype=np.float64)
+        frame = frame[counted]
+        daily.append(frame.groupby('email')['daily_profit_loss'].sum())
+        overall.append(frame.groupby('email')['overall_profit_loss'].sum())
+    if not daily:
+        empty = pd.Series(dtype=np.float64)
+        return empty, empty
+    # An email's segments may span blocks
+    return pd.concat(daily).groupby(level=0).sum(), pd.concat(overall).groupby(level=0).sum()
+
+
+def _iter_snapshot_limits(client, today_date, snapshot):
+    daily_pl, overall_pl = _snapshot_pnl(client, today_date, snapshot)
+    frames = iter_df_blocks(client, f"""
+        SELECT u.email AS email, u.balance AS balance,
+               toUInt8(toString(u.trading_today) IN ('1', 'true')) AS trading_today
+        FROM userdetails_current AS u
+        WHERE u.trading = '1' AND {shard_condition('u.email')}
+    """)
+    for frame in frames:
+        records = snapshot.lookup(frame['email'])
+        # Same users as the joins on risk_table and start_stop_table
+        keep = [record is not None and record.has_risk and record.has_schedule for record in records]
+        frame = frame[keep].copy()
+        records = [record for record, kept in zip(records, keep) if kept]
+        for column in _LIMIT_COLUMNS:
+            frame[column] = [getattr(record, column) for record in records]
+        frame['daily_profit_loss'] = frame['email'].map(daily_pl).fillna(0).to_numpy(dtype=np.float64)
+        frame['overall_profit_loss'] = frame['email'].map(overall_pl).fillna(0).to_numpy(dtype=np.float64)
+        yield frame
+
+
+def _column(frame, name):
+    return frame[name].fillna(0).to_numpy(dtype=np.float64)
+
+
+def _flag(frame, name):
+    column = frame[name]
+    if column.dtype.kind in 'biu':
+        return column.to_numpy(dtype=bool)
+    # Parsing strings is far slower; only frames not read through iter_user_limits get here
+    return column.astype(str).str.lower().isin(('1', 'true')).to_numpy()
+
+
+def evaluate_limits(frame):
+    """
+    Compute the daily and overall limit breaches for every user in one vectorized pass.
+
+    Returns two arrays of emails: users still trading today that hit a daily
+    limit, and users that hit an overall limit (from start_date onwards).
+    Users already stopped for the day are not reported again every cycle.
+    """
+    if frame.empty:
+        return np.array([], dtype=object), np.array([], dtype=object)
+
+    emails = frame['email'].to_numpy()
+    balance = _column(frame, 'balance')
+    daily_pl = _column(frame, 'daily_profit_loss')
+    overall_pl = _column(frame, 'overall_profit_loss')
+
+    daily_loss_limit = -np.abs(_column(frame, 'loss_per_day') * balance / 100)
+    daily_win_limit = np.abs(_column(frame, 'win_per_day') * balance / 100)
+    overall_loss_limit = -np.abs(_column(frame, 'overall_loss') * balance / 100)
+    overall_win_limit = np.abs(_column(frame, 'overall_win') * balance / 100)
+
+    daily_breach = ((daily_pl <= daily_loss_limit) | (daily_pl >= daily_win_limit)) & _flag(frame, 'trading_today')
+    overall_breach = (overall_pl <= overall_loss_limit) | (overall_pl >= overall_win_limit)
+    return emails[daily_breach], emails[overall_breach]
+
+
+def run_eligibility_check(client, today_date, snapshot=None):
+    """
+    Run one eligibility cycle: a single streamed columnar read, then at most two state inserts.
+
+    Limits are evaluated block by block, so only the breaching emails are
+    kept in memory for the whole cycle. A `snapshot` is refreshed first and
+    supplies the limits.
+    """
+    if snapshot is not None:
+        snapshot.refresh(client)
+    daily_blocks, overall_blocks = [], []
+    for frame in iter_user_limits(client, today_date, snapshot):
+        daily, overall = evaluate_limits(frame)
+        daily_blocks.append(daily)
+        overall_blocks.append(overall)
+    daily_breaches = np.concatenate(daily_blocks) if daily_blocks else []
+    overall_breaches = np.concatenate(overall_blocks) if overall_blocks else []
+
+    if len(daily_breaches):
+        record_user_state(client, daily_breaches, trading_today=False)
+        LIMIT_BREACHES.labels('daily', 'auto_trading_monitor').inc(len(daily_breaches))
+        for email in daily_breaches:
+            logger.info("%s has reached daily limits. Trading today disabled.", email,
+                        extra={'email': email, 'limit': 'daily'})
+
+    if len(overall_breaches):
+        record_user_state(client, overall_breaches, trading=False, trading_today=False)
+        LIMIT_BREACHES.labels('overall', 'auto_trading_monitor').inc(len(overall_breaches))
+        for email in overall_breaches:
+            logger.info("%s has reached overall limits. Trading permanently disabled.", email,
+                        extra={'email': email, 'limit': 'overall'})
+
+    return daily_breaches, overall_breaches
+
 
 async def auto_trading_monitor():
-    client = get_clickhouse_client()
+    db = get_async_clickhouse_client()
     today_date = datetime.today().date()
-    print("")
-    print(f"{BLUE}_________________________________ USER ELIGIBILITY CHECKER_______________________________{RESET}")
-    print("")
-    print(f"{BLUE}Running auto_trading_monitor at {datetime.now()}{RESET}")
+    logger.info("Running auto_trading_monitor", extra={'job': 'auto_trading_monitor'})
 
     try:
-        user_query = client.query(f"""
-            SELECT u.email, u.token, u.balance, u.balance_today,
-                   r.per_trade, r.per_day,
-                   s.loss_per_day, s.overall_loss, s.win_per_day, s.overall_win, s.start_date
-            FROM userdetails AS u
-            JOIN risk_table AS r ON u.email = r.email
-            JOIN start_stop_table AS s ON u.email = s.email
-            WHERE u.trading = '1'
-        """)
-        # print(f"{YELLOW} first query result: {user_query.result_set} {RESET}")
-        for row in user_query.result_set:
-            email, token, balance, balance_today, per_trade, per_day, loss_per_day, overall_loss, win_per_day, overall_win, start_date = row
-            
-            # Filter trades by start_date
-            start_date_str = start_date.strftime('%Y-%m-%d')  # Format the start_date to match date format in trades table
-            
-            # Calculate balance change from the start_date onwards
-            profit_loss_query = client.query(f"""
-                SELECT SUM(profit_loss)
-                FROM trades
-                WHERE email = '{email}' AND DATE(timestamp) >= '{start_date_str}' AND DATE(timestamp) = '{today_date}'
-            """)
-            # Check if profit_loss is None and default to 0 if so
-            total_profit_loss = profit_loss_query.result_set[0][0] if profit_loss_query.result_set and profit_loss_query.result_set[0][0] is not None else 0
-            
-            # Check daily limits
-            if total_profit_loss <= -abs(loss_per_day * balance / 100) or total_profit_loss >= abs(win_per_day * balance / 100):
-                trading = 'false'
-                client.command(f"""
-                    ALTER TABLE userdetails UPDATE trading_today = {trading}
-                    WHERE email = '{email}'
-                """)
-                print(f"{YELLOW}{email} has reached daily limits. Trading today disabled.{RESET}")
-            
-            # Check overall limits (from start_date onwards)
-            overall_profit_loss_query = client.query(f"""
-                SELECT SUM(profit_loss)
-                FROM trades
-                WHERE email = '{email}' AND DATE(timestamp) >= '{start_date_str}'
-            """)
-            # Check if overall_profit_loss is None and default to 0 if so
-            total_overall_profit_loss = overall_profit_loss_query.result_set[0][0] if overall_profit_loss_query.result_set and overall_profit_loss_query.result_set[0][0] is not None else 0
-            
-            if total_overall_profit_loss <= -abs(overall_loss * balance / 100) or total_overall_profit_loss >= abs(overall_win * balance / 100):
-                trading = 'false'
-                client.command(f"""
-                    ALTER TABLE userdetails UPDATE trading = {trading}, trading_today = {trading}
-                    WHERE email = '{email}'
-                """)
-                print(f"{RED}{email} has reached overall limits. Trading permanently disabled.{RESET}")
-
-        print(f"{GREEN}Balance and trading status updated successfully.{RESET}")
-
-    except Exception as e:
-        print(f"{RED}Error running auto_trading_monitor: {e}{RESET}")
-    
-    # Sleep for 5 minutes
-    print(f"{BLUE}Sleeping for 5 minutes before next check...{RESET}")
-    await asyncio.sleep(60 * 5)  
-    await auto_trading_monitor() 
+        # The cycle is blocking ClickHouse work end to end, so it runs off the loop
+        daily, overall = await db.run(
+            run_eligibility_check, await db.client(), today_date, get_config_snapshot()
+        )
+        logger.info("Trading status updated: %d daily and %d overall limit breach(es)", len(daily), len(overall),
+                    extra={'job': 'auto_trading_monitor', 'daily_breaches': len(daily),
+                           'overall_breaches': len(overall)})
+
+    except Exception:
+        logger.exception("Error running auto_trading_monitor", extra={'job': 'auto_trading_monitor'})
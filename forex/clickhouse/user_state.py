@@ -0,0 +1,97 @@
+"""
+Append-only trading state per user.
+
+`trading`, `trading_today` and `balance_today` used to be changed with
+ALTER TABLE userdetails UPDATE. Those are asynchronous mutations that rewrite
+whole parts and queue up. The jobs now append one row per (email, field) to
+user_trading_state instead, a ReplacingMergeTree versioned by updated_at, so
+a flag flip is a plain insert that is visible as soon as it returns.
+
+The userdetails_current view overlays the latest state on userdetails and is
+what readers should query. Users without state rows keep their userdetails
+values.
+"""
+from datetime import datetime, timezone
+
+from .sharding import shard_condition
+
+STATE_FIELDS = ('trading', 'trading_today', 'balance_today')
+STATE_COLUMNS = ['email', 'field', 'value', 'updated_at']
+
+
+def state_rows(emails, updated_at=None, **fields):
+    """
+    Build user_trading_state rows setting `fields` (e.g. trading=False) for every email.
+    """
+    for field in fields:
+        if field not in STATE_FIELDS:
+            raise ValueError(f"Unknown user state field: {field}")
+    updated_at = updated_at or datetime.now(timezone.utc)
+    return [
+        [email, field, float(value), updated_at]
+        for email in emails
+        for field, value in fields.items()
+    ]
+
+
+def record_user_state(client, emails, updated_at=None, **fields):
+    """
+    Append state rows for `emails` in one insert, e.g.
+    record_user_state(client, emails, trading=False, trading_today=False).
+    """
+    rows = state_rows(emails, updated_at, **fields)
+    if rows:
+        client.insert('user_trading_state', rows, column_names=STATE_COLUMNS)
+    return len(rows)
+
+
+def reset_trading_today(client, since, updated_at=None):
+    """
+    The daily reset: turn trading_today back on for every user of this shard
+    still trading, except users stopped for the day at or after `since` (a
+    daily limit hit earlier today).
+
+    Rows are stamped with the client's clock, like record_user_state, so
+    they order correctly against state rows written in the same batch.
+    """
+    updated_at = updated_at or datetime.now(timezone.utc)
+    client.command(
+        f"""
+        INSERT INTO user_trading_state (email, field, value, updated_at)
+        SELECT email, 'trading_today', 1, toDateTime64(%(updated_at)s, 6, 'UTC')
+        FROM userdetails_current
+        WHERE trading = '1' AND {shard_condition()}
+          AND email NOT IN (
+              SELECT email FROM user_trading_state
+              WHERE field = 'trading_today' AND value = 0 AND updated_at >= %(since)s
+          )
+        """,
+        # Bound datetimes lose their microseconds, so the stamp is passed as text
+        parameters={
+            'since': since,
+            'updated_at': updated_at.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f'),
+        },
+    )
+
+
+def latest_user_state(client, emails=None):
+    """
+    Return {email: {field: value}} with the latest recorded value of each field.
+
+    Only users and fields that have state rows are included; everything else
+    is still the value in userdetails.
+    """
+    where = "WHERE email IN %(emails)s" if emails is not None else ""
+    result = client.query(
+        f"""
+        SELECT email, field, argMax(value, updated_at)
+        FROM user_trading_state
+        {where}
+        GROUP BY email, field
+        """,
+        parameters={'emails': tuple(emails)} if emails is not None else None,
+    )
+    state = {}
+    for email, field, value in result.result_set:
+        state.setdefault(email, {})[field] = bool(value) if field != 'balance_today' else value
+    return state
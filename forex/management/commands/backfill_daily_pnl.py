@@ -0,0 +1,47 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from forex.clickhouse.connection import get_clickhouse_client, query_timeout
+from forex.clickhouse.schema import bootstrap_schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the daily_pnl aggregate from the trades table for every day before --until. "
+        "New trades are aggregated by the daily_pnl_mv materialized view as they are inserted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--until',
+            type=date.fromisoformat,
+            default=date.today() + timedelta(days=1),
+            help="First day NOT to rebuild (YYYY-MM-DD, default: tomorrow). Trades inserted into a "
+                 "rebuilt day while the backfill runs are counted twice, so either pause trade inserts "
+                 "or pass --until with today's date once the materialized view has a full day of data.",
+        )
+
+    def handle(self, *args, **options):
+        until = options['until']
+        client = get_clickhouse_client()
+        bootstrap_schema(client)
+
+        self.stdout.write(f"Rebuilding daily_pnl for days before {until}...")
+        # Whole-table statements, exempt from the default per-query time limit
+        no_limit = query_timeout(0)
+        client.command(
+            f"ALTER TABLE daily_pnl DELETE WHERE day < toDate('{until}')",
+            settings={'mutations_sync': 1, **no_limit},
+        )
+        client.command(f"""
+            INSERT INTO daily_pnl (email, day, profit_loss)
+            SELECT email, toDate(timestamp) AS day, toFloat64(sum(profit_loss)) AS profit_loss
+            FROM trades
+            WHERE toDate(timestamp) < toDate('{until}')
+            GROUP BY email, day
+        """, settings=no_limit)
+        client.command("OPTIMIZE TABLE daily_pnl FINAL", settings=no_limit)
+
+        rows = client.query("SELECT count() FROM daily_pnl").result_set[0][0]
+        self.stdout.write(self.style.SUCCESS(f"daily_pnl backfilled ({rows} email/day rows)."))
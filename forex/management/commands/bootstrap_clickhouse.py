@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from forex.clickhouse.connection import get_clickhouse_client
+from forex.clickhouse.schema import bootstrap_schema
+
+
+class Command(BaseCommand):
+    help = "Create the ClickHouse tables used by the background jobs, if missing."
+
+    def handle(self, *args, **options):
+        bootstrap_schema(get_clickhouse_client())
+        self.stdout.write(self.style.SUCCESS("ClickHouse schema is up to date."))
@@ -0,0 +1,111 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from forex.clickhouse.connection import get_clickhouse_client, query_timeout
+from forex.clickhouse.schema import (
+    BALANCE_RETENTION_DAYS,
+    BALANCES_ROLLUP_SELECT,
+    BALANCES_ROLLUPS,
+    BALANCES_TABLE_TEMPLATE,
+    bootstrap_schema,
+    ttl_clause,
+)
+
+NEW_LAYOUT_KEY = 'email, timestamp'
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the balances table to the (email, timestamp) layout with monthly partitions and TTL, "
+        "and rebuild the hourly/daily rollups from the full old table. Once balances has the new "
+        "layout, running it again only makes sure the schema exists. Samples written while the "
+        "rollups are rebuilt are counted twice in their sample counts, so stop the job runner first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-legacy',
+            action='store_true',
+            help="Keep the old table as balances_legacy instead of dropping it.",
+        )
+
+    def handle(self, *args, **options):
+        client = get_clickhouse_client()
+
+        sorting_key = client.query(
+            "SELECT sorting_key FROM system.tables WHERE database = currentDatabase() AND name = 'balances'"
+        ).result_set
+        if not sorting_key:
+            self.stdout.write("No balances table yet; creating it with the new layout.")
+        elif sorting_key[0][0] != NEW_LAYOUT_KEY:
+            self._migrate_table(client, options['keep_legacy'])
+        else:
+            # balances has expired rows by now, so rebuilding the rollups from
+            # it would delete the older history they still hold
+            self.stdout.write("balances already uses the (email, timestamp) layout.")
+
+        bootstrap_schema(client)
+        self.stdout.write(self.style.SUCCESS("Balance history schema is up to date."))
+
+    def _migrate_table(self, client, keep_legacy):
+        leftover = client.query(
+            "SELECT count() FROM system.tables WHERE database = currentDatabase() AND name = 'balances_legacy'"
+        ).result_set[0][0]
+        if leftover:
+            raise CommandError(
+                "balances_legacy already exists, left by an earlier run; drop or rename it and run again."
+            )
+
+        self.stdout.write("Copying balances into the new layout...")
+        # Rollup views follow the source table through a rename, so detach them
+        # from the old table first; bootstrap_schema recreates them afterwards.
+        for view, _ in BALANCES_ROLLUPS.values():
+            client.command(f"DROP VIEW IF EXISTS {view}")
+
+        client.command("DROP TABLE IF EXISTS balances_new")
+        client.command(BALANCES_TABLE_TEMPLATE.format(
+            table='balances_new', ttl=ttl_clause('timestamp', BALANCE_RETENTION_DAYS),
+        ))
+        copied_until = client.query("SELECT max(timestamp) FROM balances").result_set[0][0]
+        # Bounded, so samples written during the copy are left to the catch-up below only
+        client.command(
+            """
+            INSERT INTO balances_new (timestamp, balance, email)
+            SELECT timestamp, balance, email FROM balances
+            WHERE timestamp <= %(copied_until)s
+            """,
+            parameters={'copied_until': copied_until},
+            settings=query_timeout(0),  # whole-table copy, exempt from the default limit
+        )
+
+        client.command("RENAME TABLE balances TO balances_legacy, balances_new TO balances")
+
+        # Samples written by a running balance tracker while copying
+        client.command(
+            """
+            INSERT INTO balances (timestamp, balance, email)
+            SELECT timestamp, balance, email FROM balances_legacy
+            WHERE timestamp > %(copied_until)s
+            """,
+            parameters={'copied_until': copied_until},
+            settings=query_timeout(0),
+        )
+
+        bootstrap_schema(client)
+        # The new table drops samples past BALANCE_RETENTION_DAYS as it merges,
+        # so older history is read from the untouched old table
+        self._rebuild_rollups(client, copied_until)
+        if not keep_legacy:
+            client.command("DROP TABLE balances_legacy")
+
+    def _rebuild_rollups(self, client, copied_until):
+        for table, (_, bucket) in BALANCES_ROLLUPS.items():
+            self.stdout.write(f"Rebuilding {table}...")
+            client.command(f"TRUNCATE TABLE {table}")
+            for source, condition in (('balances_legacy', '<='), ('balances', '>')):
+                client.command(
+                    f"INSERT INTO {table} "
+                    + BALANCES_ROLLUP_SELECT.format(bucket=bucket, source=source)
+                    + f"WHERE timestamp {condition} %(copied_until)s GROUP BY email, bucket",
+                    parameters={'copied_until': copied_until},
+                    settings=query_timeout(0),
+                )
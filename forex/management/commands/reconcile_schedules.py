@@ -0,0 +1,28 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from forex.clickhouse.account_enabler import enable_disable_accounts
+from forex.clickhouse.connection import get_clickhouse_client
+from forex.clickhouse.job_logging import configure_job_logging, stop_job_logging
+from forex.clickhouse.schema import bootstrap_schema
+from forex.clickhouse.sharding import Shard, set_current_shard
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply every user's start/stop dates and the daily trading_today reset in one full pass. "
+        "The job runner applies these on time from its schedule index; run this once after "
+        "editing start_stop_table outside the app or restoring user_trading_state."
+    )
+
+    def handle(self, *args, **options):
+        # One pass over every user, whatever shard this node's environment names
+        set_current_shard(Shard())
+        configure_job_logging(fmt='text')
+        try:
+            bootstrap_schema(get_clickhouse_client())
+            asyncio.run(enable_disable_accounts())
+        finally:
+            stop_job_logging()
+        self.stdout.write(self.style.SUCCESS("Start/stop dates reconciled."))
@@ -0,0 +1,174 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from multiprocessing.connection import wait
+
+from django.core.management.base import BaseCommand, CommandError
+
+from forex.clickhouse.connection import get_clickhouse_client
+from forex.clickhouse.job_logging import configure_job_logging, stop_job_logging
+from forex.clickhouse.leader import ClickHouseLease, FileLease, NoLease
+from forex.clickhouse.metrics import METRICS_PORT, start_metrics_server
+from forex.clickhouse.sharding import SHARD_COUNT, SHARD_INDEX, Shard, set_current_shard
+from forex.clickhouse.tasks import run_as_leader
+
+# Seconds before a shard process that exited is started again
+SHARD_RESTART_DELAY = 5
+
+
+def _raise_system_exit(signum, frame):
+    sys.exit(0)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the background jobs (account enabler, balance tracker, eligibility checker). "
+        "Web processes never start them; run exactly one of these per deployment. "
+        "Extra runners wait as standbys behind a leader lease. "
+        "With --processes or --shard-count the users are split into shards by a hash "
+        "of their email and each process runs the jobs for one shard."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lease',
+            choices=['file', 'clickhouse', 'none'],
+            default=os.getenv('JOB_LEASE', 'file'),
+            help="How runners agree on a single leader (default: $JOB_LEASE or 'file'). "
+                 "Use 'clickhouse' when runners are in separate containers.",
+        )
+        parser.add_argument(
+            '--lease-file',
+            default=os.getenv('JOB_LEASE_FILE', '/tmp/forex-jobs.lock'),
+            help="Lock file for --lease=file.",
+        )
+        parser.add_argument(
+            '--lease-ttl',
+            type=int,
+            default=int(os.getenv('JOB_LEASE_TTL', '60')),
+            help="Seconds a ClickHouse lease stays valid without renewal.",
+        )
+        parser.add_argument(
+            '--metrics-port',
+            type=int,
+            default=METRICS_PORT,
+            help="Port serving Prometheus metrics (default: $METRICS_PORT or 9100, 0 to disable). "
+                 "Shard processes use consecutive ports from this one.",
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=int(os.getenv('JOB_PROCESSES', '1')),
+            help="Shard processes to run on this node, one shard each (default: $JOB_PROCESSES or 1).",
+        )
+        parser.add_argument(
+            '--shard-count',
+            type=int,
+            default=None,
+            help="Total shards across all nodes (default: $SHARD_COUNT, at least --processes).",
+        )
+        parser.add_argument(
+            '--shard-index',
+            type=int,
+            default=SHARD_INDEX,
+            help="First shard run by this node (default: $SHARD_INDEX or 0).",
+        )
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        count = options['shard_count'] or max(SHARD_COUNT, processes)
+        first = options['shard_index']
+        if processes < 1 or first < 0 or first + processes > count:
+            raise CommandError(
+                f"Shards {first}..{first + processes - 1} do not fit in a shard count of {count}"
+            )
+        shards = [Shard(index, count) for index in range(first, first + processes)]
+
+        if processes == 1:
+            try:
+                self._run_shard(shards[0], options, options['metrics_port'])
+            except KeyboardInterrupt:
+                self.stdout.write("Stopping background jobs.")
+            return
+        self._supervise(shards, options)
+
+    def _run_shard(self, shard, options, metrics_port):
+        """
+        Run the jobs for one shard in this process until interrupted.
+        """
+        set_current_shard(shard)
+        configure_job_logging(fields={'shard': shard.index} if shard.count > 1 else None)
+        try:
+            if start_metrics_server(metrics_port):
+                self.stdout.write(f"Serving metrics for shard {shard.index} on port {metrics_port}.")
+            lease = self._lease(options, shard)
+            asyncio.run(run_as_leader(lease, renew_interval=max(1, options['lease_ttl'] // 3)))
+        finally:
+            stop_job_logging()
+
+    def _shard_process(self, shard, options, metrics_port):
+        # Let SIGTERM unwind run_as_leader so the shard's lease is released
+        signal.signal(signal.SIGTERM, _raise_system_exit)
+        try:
+            self._run_shard(shard, options, metrics_port)
+        except (KeyboardInterrupt, SystemExit):
+            pass
+
+    def _supervise(self, shards, options):
+        """
+        Run one forked process per shard and restart any that exits.
+        """
+        context = multiprocessing.get_context('fork')
+        ports = {
+            shard.index: options['metrics_port'] + offset if options['metrics_port'] else 0
+            for offset, shard in enumerate(shards)
+        }
+
+        def start(shard):
+            process = context.Process(
+                target=self._shard_process, args=(shard, options, ports[shard.index]),
+                name=f"forex-jobs{shard.suffix}",
+            )
+            process.start()
+            return process
+
+        signal.signal(signal.SIGTERM, _raise_system_exit)
+        running = {}
+        try:
+            for shard in shards:
+                running[shard.index] = (shard, start(shard))
+            self.stdout.write(
+                f"Running shards {shards[0].index}..{shards[-1].index} of {shards[0].count} "
+                f"in {len(shards)} processes."
+            )
+            while True:
+                wait([process.sentinel for _, process in running.values()])
+                exited = [(shard, process) for shard, process in running.values() if not process.is_alive()]
+                for shard, process in exited:
+                    self.stderr.write(
+                        f"Shard {shard.index} exited with code {process.exitcode}, "
+                        f"restarting in {SHARD_RESTART_DELAY} seconds."
+                    )
+                time.sleep(SHARD_RESTART_DELAY)
+                for shard, _ in exited:
+                    running[shard.index] = (shard, start(shard))
+        except (KeyboardInterrupt, SystemExit):
+            self.stdout.write("Stopping background jobs.")
+        finally:
+            for _, process in running.values():
+                if process.is_alive():
+                    process.terminate()
+            for _, process in running.values():
+                process.join()
+
+    def _lease(self, options, shard):
+        # Each shard has its own leader, so standbys can take over any shard
+        if options['lease'] == 'clickhouse':
+            return ClickHouseLease(get_clickhouse_client(), f"forex-jobs{shard.suffix}", ttl=options['lease_ttl'])
+        if options['lease'] == 'file':
+            root, ext = os.path.splitext(options['lease_file'])
+            return FileLease(f"{root}{shard.suffix}{ext}")
+        return NoLease()
@@ -182,6 +182,15 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Balance history API (performance/views.py): seconds a response is cached per
+# (email, range, resolution), and the largest range (in samples) kept in cache.
+BALANCE_HISTORY_CACHE_TTL = int(os.getenv('BALANCE_HISTORY_CACHE_TTL', '60'))
+BALANCE_HISTORY_CACHE_MAX_POINTS = int(os.getenv('BALANCE_HISTORY_CACHE_MAX_POINTS', '5000'))
+
+# Start the background jobs inside the serving process (forex/apps.py). Only
+# for single-process setups; deployments run `python manage.py run_jobs`.
+FOREX_START_JOBS = os.getenv('FOREX_START_JOBS', 'false').lower() in ('1', 'true', 'yes')
+
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
@@ -0,0 +1,213 @@
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+
+from benchmarks.import_time import PACKAGE_BUDGET_MS, SETUP_BUDGET_MS, STEPS, time_import
+from forex.clickhouse.insert_buffer import InsertBuffer
+from forex.clickhouse.risk_engine import RiskEngine, UserRisk
+from forex.clickhouse.schedule_index import DAY, START, STOP, ScheduleIndex
+from forex.clickhouse.user_eligibility_checker import evaluate_limits
+
+
+class ImportTimeTests(SimpleTestCase):
+    """
+    Importing the project stays within budget and never connects to ClickHouse.
+
+    Each step runs in a fresh interpreter with CLICKHOUSE_HOST unroutable, so
+    an import-time connection shows up as a timeout.
+    """
+
+    def test_imports_within_budget(self):
+        budgets = {'package': PACKAGE_BUDGET_MS, 'setup': SETUP_BUDGET_MS}
+        for label, kind, code in STEPS:
+            with self.subTest(step=label):
+                seconds = time_import(code, timeout=max(10, budgets[kind] / 1000 * 3))
+                self.assertIsNotNone(seconds, f"{label} timed out; does it connect to ClickHouse?")
+                self.assertLessEqual(seconds * 1000, budgets[kind], f"{label} is over its import-time budget")
+
+
+class ScheduleIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.index = ScheduleIndex('UTC')
+        self.now = datetime(2025, 6, 10, 12, tzinfo=timezone.utc)
+
+    def midnight(self, day):
+        return datetime.combine(day, datetime.min.time(), timezone.utc)
+
+    def test_midnight_is_in_the_schedule_timezone(self):
+        index = ScheduleIndex('Europe/Berlin')
+        self.assertEqual(index.midnight(date(2025, 6, 10)), datetime(2025, 6, 9, 22, tzinfo=timezone.utc))
+
+    def test_future_transitions_pop_in_time_then_apply_order(self):
+        self.index.set_schedule('stop@x', date(2025, 6, 1), date(2025, 6, 11), self.now, None)
+        self.index.set_schedule('start@x', date(2025, 6, 11), date(2025, 7, 1), self.now, None)
+        self.index.set_schedule('later@x', date(2025, 6, 12), date(2025, 7, 1), self.now, None)
+        self.index.schedule_day(self.now)
+
+        self.assertEqual(self.index.next_due(), self.midnight(date(2025, 6, 11)))
+        self.assertEqual(self.index.pop_due(self.now), [])
+        # The daily reset comes first, so a stop at the same midnight wins
+        self.assertEqual(
+            self.index.pop_due(self.midnight(date(2025, 6, 11))),
+            [(DAY, None), (START, 'start@x'), (STOP, 'stop@x')],
+        )
+        self.assertEqual(self.index.next_due(), self.midnight(date(2025, 6, 12)))
+
+    def test_changed_schedule_drops_its_old_transitions(self):
+        self.index.set_schedule('a@x', date(2025, 6, 11), date(2025, 7, 1), self.now, None)
+        self.index.set_schedule('a@x', date(2025, 6, 20), date(2025, 7, 1), self.now, None)
+        self.assertEqual(self.index.next_due(), self.midnight(date(2025, 6, 20)))
+
+        self.index.remove('a@x')
+        self.assertIsNone(self.index.next_due())
+        self.assertEqual(self.index.pop_due(self.midnight(date(2025, 8, 1))), [])
+
+    def test_overdue_stop_is_due_at_once(self):
+        due = self.index.set_schedule('a@x', date(2025, 5, 1), date(2025, 6, 1), self.now, None)
+        self.assertEqual(due, [(STOP, 'a@x')])
+        self.assertIsNone(self.index.next_due())
+
+    def test_passed_start_is_due_only_after_the_watermark(self):
+        start = date(2025, 6, 5)
+        applied = self.midnight(start) - timedelta(microseconds=1)
+        self.assertEqual(
+            self.index.set_schedule('new@x', start, date(2025, 7, 1), self.now, applied), [(START, 'new@x')]
+        )
+        applied = self.midnight(start)
+        self.assertEqual(self.index.set_schedule('old@x', start, date(2025, 7, 1), self.now, applied), [])
+
+    def test_passed_start_is_due_when_it_changes(self):
+        self.index.set_schedule('a@x', date(2025, 6, 1), date(2025, 7, 1), self.now, self.now)
+        self.assertEqual(self.index.set_schedule('a@x', date(2025, 6, 1), date(2025, 7, 1), self.now, None), [])
+        self.assertEqual(
+            self.index.set_schedule('a@x', date(2025, 6, 2), date(2025, 7, 1), self.now, None), [(START, 'a@x')]
+        )
+
+
+def _limits(**columns):
+    frame = {
+        'email': ['a@x'], 'balance': [1000.0], 'trading_today': [1],
+        'loss_per_day': [5.0], 'overall_loss': [20.0], 'win_per_day': [10.0], 'overall_win': [50.0],
+        'daily_profit_loss': [0.0], 'overall_profit_loss': [0.0],
+    }
+    frame.update(columns)
+    return pd.DataFrame(frame)
+
+
+class EvaluateLimitsTests(SimpleTestCase):
+
+    def test_limits_are_percentages_of_the_balance(self):
+        frame = _limits(
+            email=['loss@x', 'win@x', 'inside@x', 'overall@x'],
+            balance=[1000.0] * 4, trading_today=[1] * 4,
+            loss_per_day=[5.0] * 4, overall_loss=[20.0] * 4, win_per_day=[10.0] * 4, overall_win=[50.0] * 4,
+            daily_profit_loss=[-50.0, 100.0, 99.0, 0.0],
+            overall_profit_loss=[0.0, 0.0, 499.0, -200.0],
+        )
+        daily, overall = evaluate_limits(frame)
+        self.assertEqual(list(daily), ['loss@x', 'win@x'])
+        self.assertEqual(list(overall), ['overall@x'])
+
+    def test_users_stopped_for_today_are_not_reported_again(self):
+        daily, _ = evaluate_limits(_limits(trading_today=[0], daily_profit_loss=[-500.0]))
+        self.assertEqual(list(daily), [])
+
+    def test_string_flags_and_missing_limits(self):
+        frame = _limits(
+            email=['a@x', 'b@x'], balance=[1000.0, 1000.0], trading_today=['true', '0'],
+            loss_per_day=[5.0, 5.0], overall_loss=[np.nan, np.nan], win_per_day=[10.0, 10.0],
+            overall_win=[np.nan, np.nan], daily_profit_loss=[-60.0, -60.0], overall_profit_loss=[1.0, 1.0],
+        )
+        daily, overall = evaluate_limits(frame)
+        self.assertEqual(list(daily), ['a@x'])
+        # A missing limit is 0% of the balance, so any profit reaches it
+        self.assertEqual(list(overall), ['a@x', 'b@x'])
+
+    def test_empty_frame(self):
+        daily, overall = evaluate_limits(_limits().iloc[:0])
+        self.assertEqual((len(daily), len(overall)), (0, 0))
+
+
+class RiskEngineTests(SimpleTestCase):
+
+    def setUp(self):
+        self.today = date(2025, 6, 10)
+        self.engine = RiskEngine()
+        self.engine.today = self.today
+
+    def add_user(self, email='a@x', **kwargs):
+        # Daily limits -50/+100 and overall limits -200/+500
+        self.engine.users[email] = UserRisk(1000.0, 5.0, 10.0, 20.0, 50.0, date(2025, 6, 1), **kwargs)
+
+    def test_daily_breach_is_reported_once(self):
+        self.add_user()
+        self.assertIsNone(self.engine.apply('a@x', self.today, -49.0))
+        self.assertEqual(self.engine.apply('a@x', self.today, -1.0), 'daily')
+        self.assertIsNone(self.engine.apply('a@x', self.today, -10.0))
+
+    def test_user_halted_when_seeded_is_not_breached_again(self):
+        self.add_user(daily_pl=-60.0, halted_today=True)
+        self.assertIsNone(self.engine.apply('a@x', self.today, -1.0))
+
+    def test_overall_breach_stops_tracking_the_user(self):
+        self.add_user(overall_pl=-150.0)
+        self.assertEqual(self.engine.apply('a@x', self.today - timedelta(days=1), -50.0), 'overall')
+        self.assertNotIn('a@x', self.engine.users)
+        self.assertIsNone(self.engine.apply('a@x', self.today, -1000.0))
+
+    def test_only_counted_days_move_the_totals(self):
+        self.add_user()
+        self.engine.apply('a@x', self.today - timedelta(days=1), -30.0)
+        self.engine.apply('a@x', date(2025, 5, 1), -300.0)
+        user = self.engine.users['a@x']
+        self.assertEqual((user.daily_pl, user.overall_pl), (0.0, -30.0))
+
+    def test_unknown_user(self):
+        self.assertIsNone(self.engine.apply('nobody@x', self.today, -1000.0))
+
+
+class _FlakyClient:
+    def __init__(self, failures):
+        self.failures = failures
+        self.inserts = []
+
+    def insert(self, table, rows, column_names=None):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("ClickHouse is unavailable")
+        self.inserts.append((table, list(rows), column_names))
+
+
+class InsertBufferTests(SimpleTestCase):
+
+    def test_failed_flush_keeps_rows_for_the_next_one(self):
+        client = _FlakyClient(failures=1)
+        buffer = InsertBuffer(client, 'balances', ['email', 'balance'], auto_flush=False)
+        buffer.add(('a@x', 1.0))
+        with self.assertRaises(ConnectionError):
+            buffer.flush()
+        buffer.add(('b@x', 2.0))
+        self.assertEqual(len(buffer), 2)
+
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(client.inserts, [('balances', [('a@x', 1.0), ('b@x', 2.0)], ['email', 'balance'])])
+        self.assertEqual((len(buffer), buffer.flush()), (0, 0))
+
+    def test_auto_flush_at_max_rows(self):
+        client = _FlakyClient(failures=0)
+        buffer = InsertBuffer(client, 'balances', ['email', 'balance'], max_rows=2)
+        buffer.add(('a@x', 1.0))
+        self.assertFalse(buffer.due)
+        buffer.add(('b@x', 2.0))
+        self.assertEqual(len(client.inserts), 1)
+        self.assertEqual(len(buffer), 0)
+
+    def test_due_after_max_age(self):
+        buffer = InsertBuffer(_FlakyClient(failures=0), 'balances', ['email', 'balance'], max_age=0,
+                              auto_flush=False)
+        self.assertFalse(buffer.due)
+        buffer.add(('a@x', 1.0))
+        self.assertTrue(buffer.due)
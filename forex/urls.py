@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.urls import path
 from authorise_deriv.views import authorize_user
+from performance.views import balance_history
 from django.urls import include, path
 
 # bot setting urls
@@ -32,6 +33,7 @@ urlpatterns = [
 
     path('admin/', admin.site.urls),
     path('authorize/', authorize_user, name='authorize_user'),
+    path('balance-history/', balance_history, name='balance_history'),
     # path('generate-guest-token/', get_guest_token, name='generate_guest_token'),
     # path('notifications/', include('notifications.routes')),   
     # path('trade/', include('trade.routes')),   
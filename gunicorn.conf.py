@@ -0,0 +1,32 @@
+"""
+Gunicorn settings for the web role, read from the environment.
+
+SERVER_MODE=asgi (default) serves forex.asgi with uvicorn workers, so async
+views such as /authorize/ run on each worker's long-lived event loop.
+SERVER_MODE=wsgi serves forex.wsgi with sync workers, where Django runs
+every async view on a new event loop per request.
+
+Compare both with `python -m benchmarks.authorize_load`.
+"""
+import multiprocessing
+import os
+
+SERVER_MODE = os.getenv('SERVER_MODE', 'asgi')
+
+bind = f":{os.getenv('PORT', '9091')}"
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'forex.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+    # One event loop per worker handles many requests at once; one per core is enough
+    default_workers = multiprocessing.cpu_count()
+else:
+    wsgi_app = 'forex.wsgi:application'
+    worker_class = 'sync'
+    default_workers = multiprocessing.cpu_count() * 2 + 1
+
+workers = int(os.getenv('WEB_CONCURRENCY', str(default_workers)))
+# Seconds an idle client connection is kept open for its next request
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
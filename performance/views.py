@@ -0,0 +1,213 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from deriv_api.errors import ResponseError
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.http import require_GET
+
+from authorise_deriv.resilience import TRANSIENT_ERRORS, CircuitOpenError
+from authorise_deriv.views import authorize_cache
+from forex.clickhouse.async_client import get_async_clickhouse_client
+from forex.clickhouse.balance_history import RESOLUTIONS, history_query, pick_resolution
+from forex.clickhouse.connection import get_clickhouse_client
+from forex.clickhouse.streaming import iter_row_blocks
+
+# Seconds a response (or just its validators) is served from cache
+CACHE_TTL = getattr(settings, 'BALANCE_HISTORY_CACHE_TTL', 60)
+# Ranges with more samples than this are streamed and only their validators cached
+CACHE_MAX_POINTS = getattr(settings, 'BALANCE_HISTORY_CACHE_MAX_POINTS', 5000)
+DEFAULT_RANGE = timedelta(days=30)
+
+
+def _default_end():
+    # Rounded up to the cache TTL, so polls of the default range share one
+    # cache entry and ETag instead of a new one every second
+    step = max(1, CACHE_TTL)
+    now = datetime.now().timestamp()
+    return datetime.fromtimestamp(-(-now // step) * step)
+
+
+def _parse_range(request):
+    end = request.GET.get('end')
+    start = request.GET.get('start')
+    end = datetime.fromisoformat(end) if end else _default_end()
+    start = datetime.fromisoformat(start) if start else end - DEFAULT_RANGE
+    if start.tzinfo is not None or end.tzinfo is not None:
+        raise ValueError("start and end must be naive (server time) ISO datetimes")
+    if start >= end:
+        raise ValueError("start must be before end")
+    return start, end
+
+
+async def _authorized_email(request):
+    """
+    Email of the Deriv account whose token is in the Authorization header, or an error response.
+
+    The token is checked like a POST to /authorize/, through the same cache.
+    """
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        response = JsonResponse({"error": "Authorization: Bearer <Deriv token> is required"}, status=401)
+        response['WWW-Authenticate'] = 'Bearer'
+        return None, response
+    try:
+        authorize = await authorize_cache.authorize(token.strip())
+    except CircuitOpenError as e:
+        response = JsonResponse({"error": str(e)}, status=503)
+        response["Retry-After"] = str(max(1, round(e.retry_after)))
+        return None, response
+    except ResponseError as e:
+        return None, JsonResponse({"error": e.message}, status=503 if e.code in TRANSIENT_ERRORS else 401)
+    return authorize.get('authorize', {}).get('email'), None
+
+
+async def _freshness(email, start, end):
+    """
+    Latest sample time and sample count in the range; cheap with balances ordered by (email, timestamp).
+    """
+    result = await get_async_clickhouse_client().query(
+        """
+        SELECT max(timestamp), count()
+        FROM balances
+        WHERE email = %(email)s AND timestamp >= %(start)s AND timestamp < %(end)s
+        """,
+        parameters={'email': email, 'start': start, 'end': end},
+    )
+    last_sample, samples = result.result_set[0]
+    return (last_sample if samples else None), samples
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since') or '')
+    return bool(if_modified_since and last_modified and last_modified <= if_modified_since)
+
+
+def _with_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = f'private, max-age={CACHE_TTL}'
+    return response
+
+
+def _point(row):
+    bucket, open_balance, close_balance, min_balance, max_balance, samples = row
+    return {
+        'time': bucket.isoformat(),
+        'open': open_balance,
+        'close': close_balance,
+        'min': min_balance,
+        'max': max_balance,
+        'samples': samples,
+    }
+
+
+def _stream_body(header, sql, parameters):
+    """
+    Yield the JSON document in chunks: the header, then one row block at a time.
+    """
+    yield json.dumps(header)[:-1] + ', "points": ['
+    first = True
+    for block in iter_row_blocks(get_clickhouse_client(), sql, parameters=parameters):
+        chunk = ", ".join(json.dumps(_point(row)) for row in block)
+        if chunk:
+            yield chunk if first else ", " + chunk
+            first = False
+    yield "]}"
+
+
+async def _astream_body(header, sql, parameters):
+    """
+    Async version of _stream_body for ASGI, which buffers a sync iterator whole before sending it.
+    """
+    yield json.dumps(header)[:-1] + ', "points": ['
+    first = True
+    async for block in get_async_clickhouse_client().iter_row_blocks(sql, parameters=parameters):
+        chunk = ", ".join(json.dumps(_point(row)) for row in block)
+        if chunk:
+            yield chunk if first else ", " + chunk
+            first = False
+    yield "]}"
+
+
+@require_GET
+async def balance_history(request):
+    """
+    Balance history for the user whose Deriv token is sent as `Authorization: Bearer <token>`.
+
+    Query parameters: email (optional, must be the token's account), start
+    and end (ISO datetimes, default the 30 days up to now, with end rounded
+    up to BALANCE_HISTORY_CACHE_TTL seconds) and resolution (raw,
+    hour or day; chosen from the range when omitted). Large ranges are
+    streamed as chunked JSON; responses carry ETag/Last-Modified and are
+    cached for BALANCE_HISTORY_CACHE_TTL seconds per (email, range, resolution).
+    """
+    email, error = await _authorized_email(request)
+    if error is not None:
+        return error
+    if not email:
+        return JsonResponse({"error": "The Deriv account has no email"}, status=403)
+    requested = request.GET.get('email')
+    if requested and requested.lower() != email.lower():
+        return JsonResponse({"error": "email does not match the authorized account"}, status=403)
+    resolution = request.GET.get('resolution') or None
+    if resolution is not None and resolution not in RESOLUTIONS:
+        return JsonResponse({"error": f"resolution must be one of {', '.join(RESOLUTIONS)}"}, status=400)
+    try:
+        start, end = _parse_range(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    resolution = pick_resolution(start, end, resolution)
+    cache_key = 'balance-history:' + hashlib.sha256(
+        f"{email}|{start.isoformat()}|{end.isoformat()}|{resolution}".encode()
+    ).hexdigest()
+
+    cached = await cache.aget(cache_key)
+    if cached is not None:
+        etag, last_modified, body = cached
+        if _not_modified(request, etag, last_modified):
+            return _with_validators(HttpResponseNotModified(), etag, last_modified)
+        if body is not None:
+            response = HttpResponse(body, content_type='application/json')
+            return _with_validators(response, etag, last_modified)
+
+    last_sample, samples = await _freshness(email, start, end)
+    last_modified = int(last_sample.timestamp()) if last_sample else None
+    etag = quote_etag(hashlib.sha256(
+        f"{cache_key}|{last_modified}|{samples}".encode()
+    ).hexdigest()[:32])
+
+    if _not_modified(request, etag, last_modified):
+        await cache.aset(cache_key, (etag, last_modified, None), CACHE_TTL)
+        return _with_validators(HttpResponseNotModified(), etag, last_modified)
+
+    header = {
+        'email': email,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'resolution': resolution,
+    }
+    sql, parameters = history_query(email, start, end, resolution)
+
+    if samples <= CACHE_MAX_POINTS:
+        body = "".join([chunk async for chunk in _astream_body(header, sql, parameters)]).encode()
+        await cache.aset(cache_key, (etag, last_modified, body), CACHE_TTL)
+        response = HttpResponse(body, content_type='application/json')
+    else:
+        await cache.aset(cache_key, (etag, last_modified, None), CACHE_TTL)
+        # Each server mode streams only the iterator kind it consumes natively
+        if isinstance(request, ASGIRequest):
+            body = _astream_body(header, sql, parameters)
+        else:
+            body = _stream_body(header, sql, parameters)
+        response = StreamingHttpResponse(body, content_type='application/json')
+    return _with_validators(response, etag, last_modified)